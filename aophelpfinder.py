@@ -34,8 +34,11 @@ import compute_scores as cscores
 import compute_output as cout
 import create_collection_event as ev
 import datetime
-import results_filter as rf 
 import tm_module as tm
+import pipeline
+import preprocess_cache
+import result_table
+import profiling
 import time
 start_time = time.time()
 
@@ -50,82 +53,90 @@ parser.add_argument("--output", type=str, help="output filename")
 parser.add_argument("--stats", type=str)
 parser.add_argument("--context_choice", type=bool, help="use modulateur")
 parser.add_argument("--intro", type=int)
-args = parser.parse_args()
-
-
-
-abstracts_file = args.abst
-events_file = args.events
-output_name = args.output
-cleaning=args.cleaning
-outputtype=args.outputtype
-intro=args.intro/100.0
-if(outputtype=="tsv_abstracts"):
-    output_abstr=True
-    output_abstr_txt=False
-elif(outputtype=="txt_format"):
-    output_abstr_txt=True
-    output_abstr=False
-else:
-    output_abstr=False    
-    output_abstr_txt=False
-    
-if(cleaning=="cleaning-yes"):
-    lemma_supp=True
-    modal_supp=True
-    modulateur_supp=True
-    context_choice=True
-else:
-    lemma_supp=False
-    modal_supp=False
-    modulateur_supp=False
-    context_choice=False
-
-
-
-if lemma_supp is True or modal_supp is True or modulateur_supp is True:
-    res_filter=True
-else:
-    res_filter=False
-    
-stat=args.stats   
-stats_file =open(stat,"a")
-chem_name = abstracts_file.split(".")[0].split("/")[7].replace("-"," ")
-
-
-dict_abstracts = exxml.get_abstracts_from_pubmedfile(abstracts_file,context_choice)
-
-stats_file.write(chem_name + "\t" + str(len(dict_abstracts)))
-
-
-
-list_events = ev.create_collection_event(events_file)
-
-print(abstracts_file + "   " + str(len(dict_abstracts)))
-
-
-for abstract in dict_abstracts:
-    score = cscores.compute_scores(abstract,list_events,intro)
-    if score:
-        abstract['score']=score
-
-if res_filter is True : 
-	for event in list_events :
-		lemma_name, __ = tm.clean_abstract(event["name"], True, True, "lemma",context_choice)
-		event["lemma_name"] = lemma_name
-	dict_abstracts = rf.results_filter(dict_abstracts, list_events, lemma_supp, modal_supp, modulateur_supp,context_choice)
-
-filename= output_name
-
-if(output_abstr):
-    output_file=open(filename+".tsv","w")
-    cout.results_abstracts_to_tsv(dict_abstracts, output_file, list_events)
-elif(output_abstr_txt):
-    output_file=open(filename+".txt", "w")
-    output_file_tsv=open(filename+".tsv","w")
-    cout.results_abstracts_txt(dict_abstracts, output_file, list_events)
-    cout.results_to_tsv(dict_abstracts, output_file_tsv, list_events)
-else:
-    output_file=open(filename+".tsv","w")
-    cout.results_to_tsv(dict_abstracts, output_file, list_events)
-
+parser.add_argument("--workers", type=int, default=1, help="number of processes used to score the abstracts")
+parser.add_argument("--spacy_batch_size", type=int, default=256, help="batch size of the lemmatisation (nlp.pipe)")
+parser.add_argument("--spacy_n_process", type=int, default=1, help="processes of the lemmatisation (nlp.pipe), with --workers 1")
+parser.add_argument("--memo_size", type=int, default=100000, help="sentences kept by each stem/lemma memo")
+parser.add_argument("--events_bundle", type=str, help="compiled events file (default: events file + .<options key>.bundle)")
+parser.add_argument("--cache", type=str, help="cache file of the preprocessed abstracts (SQLite)")
+parser.add_argument("--cache_size", type=int, default=1024, help="maximal size of the cache, in MB")
+parser.add_argument("--resume", type=str, help="resume file of the stressor (resume-XX.tsv), optional")
+parser.add_argument("--profile", action="store_true", help="profile the run with cProfile (output file + .pstats)")
+parser.add_argument("--table", type=str, help="folder of the compact table of the links (see result_table), optional")
+
+
+def main(args):
+    # the whole run is profiled with --profile
+    profiler = profiling.start_profile() if args.profile else None
+    abstracts_file = args.abst
+    events_file = args.events
+    output_name = args.output
+    cleaning=args.cleaning
+    outputtype=args.outputtype
+    tm.set_memo_size(args.memo_size)
+    options = pipeline.make_options(args.intro, cleaning, args.spacy_batch_size, args.spacy_n_process)
+    context_choice = options["context_choice"]
+
+    stat=args.stats   
+    stats_file =open(stat,"a")
+    chem_name = abstracts_file.split(".")[0].split("/")[7].replace("-"," ")
+
+
+    with profiling.stage("events"):
+        list_events = ev.load_events(events_file, options, args.events_bundle)
+
+    filename= output_name
+
+    # the abstracts are parsed, scored, filtered and written one at a time
+    stream = cout.open_stream(filename, outputtype, list_events, args.resume)
+
+    # the text mining of the abstracts is done by the workers
+    abstracts = exxml.iter_abstracts_from_pubmedfile(abstracts_file, context_choice, preprocess=False)
+    abstracts = profiling.timed_iter("parse", abstracts)
+    abstracts = (abstract for abstract in abstracts if not abstract.get('delete'))
+    cache = None
+    if args.cache:
+        cache = preprocess_cache.open_cache(args.cache, args.cache_size)
+    # the links are also kept in a compact table (see result_table)
+    table = result_table.new_table(list_events) if args.table else None
+    nb_abstracts = 0
+    for abstract in pipeline.process_abstracts(abstracts, list_events, options, args.workers, cache=cache):
+        nb_abstracts += 1
+        # the output stage is timed by compute_output (in its writer thread)
+        cout.write_abstract(stream, abstract)
+        if table is not None:
+            with profiling.stage("table"):
+                result_table.add_abstract(table, abstract)
+    cout.close_stream(stream)
+    if table is not None:
+        with profiling.stage("table"):
+            result_table.export_table(table, args.table)
+
+    stats_file.write(chem_name + "\t" + str(nb_abstracts))
+    cache_stats = {}
+    if cache is not None:
+        preprocess_cache.close_cache(cache)
+        stats_file.write(preprocess_cache.stats_line(cache))
+        cache_stats = {key: cache[key] for key in ("hits", "misses", "evictions")}
+
+    # timers and counters of the run, next to the stats file
+    snapshot = profiling.take()
+    snapshot["counters"].update(cscores.scoring_counters)
+    record = profiling.run_record(snapshot, stressor=chem_name, abstracts_file=abstracts_file,
+                                  abstracts=nb_abstracts, events=len(list_events), workers=args.workers,
+                                  wall=time.time() - start_time, cpu=time.process_time(),
+                                  load_timings=dict(tm.load_timings), memo=tm.memo_stats(), cache=cache_stats)
+    profiling.write_record(profiling.sidecar_path(stat), record)
+    profiling.stop_profile(profiler, output_name + ".pstats")
+
+    print(abstracts_file + "   " + str(nb_abstracts))
+
+    # startup and model load timings of the text mining tools
+    sys.stderr.write("total\t{:.3f}s\n".format(time.time() - start_time))
+    tm.report_timings()
+    tm.report_memo()
+    cscores.report_pruning()
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+#authors: Florence Jornod - INSERM UMRS 1124
+#         Thomas Jaylet - Université de Paris - France
+#         Karine Audouze - Université de Paris - France
+
+#contact: systox@paris-descartes.fr
+
+
+#AOP-helpFinder is provided without any warranty. But if you have any probleme please feel free to contact us by mail.
+
+#------- WHAT IS AOPHELPFINDER? -------------
+
+#AOP-helpFinder is a tool developed to help AOP development (Jean-Charles Carvaillo: https://github.com/jecarvaill/aop-helpFinder)(Environ Health Perspect. 2019 Apr;127(4):47005).
+
+#It is based on text mining and parsing process on scientific abstracts. AOP-helpFinder identify links between stressors and molecular initiating event, key events and adverse outcomes through abstracts from the PubMed database (https://pubmed.ncbi.nlm.nih.gov/).
+
+#AOP-helpFinder was implemented under the H2020 Human Biomonintoring in Europe (HBM4EU) project, Work Package 13.1.
+#HBM4EU has received funding from the European Union’s H2020 research and innovation programme under grant agreement No 733032.
+
+#------- LICENCE ---------------------------
+
+#This software is governed by the CeCILL license under French law and abiding by the rules of distribution of free software.  You can  use,  modify and/ or redistribute the software under the terms of the CeCILL license as circulated by CEA, CNRS and INRIA at the following URL
+
+#http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
+#-------------------------------------------
+"""
+Batch mode: run AOP-helpFinder on many stressors in one process.
+
+The stressor files are given by a manifest (one PubMed XML path per line) or
+a directory. The events are read and preprocessed once, the stressors are
+scheduled on a pool of workers, and every stressor gets its output-XX.tsv and
+resume-XX.tsv in the results folder, plus one line in the consolidated
+stats.txt.
+
+With --dedup, the abstracts shared by several stressors (same PMID and same
+text, e.g. a parent compound and its metabolites) are scored only once: the
+stressors are streamed one after the other, the abstracts not seen yet are
+scored (with --workers processes), and only the scores of the abstracts seen
+are kept (by PMID and hash of the text) for the next stressors.
+
+    python batch.py --dir stressors/ --events events.csv --results results/ \
+        --cleaning cleaning-yes --intro 20 --workers 8 [--dedup]
+"""
+import argparse
+import collections
+import glob
+import hashlib
+import multiprocessing
+import os
+import sys
+import time
+import extract_xml_withpmid as exxml
+import compute_output as cout
+import compute_scores as cscores
+import create_collection_event as ev
+import pipeline
+import preprocess_cache
+import profiling
+import tm_module as tm
+
+
+def stressor_files(manifest=None, directory=None):
+    ''' METHOD: list the stressor files of a batch
+    ARGUMENTS: manifest -> a file with one PubMed XML path per line (empty lines and # comments ignored)
+               directory -> a folder of PubMed XML files (.xml or .xml.gz)
+    RETURN: paths -> the list of the files, in the order of the manifest or sorted by name
+    '''
+    paths = []
+    if manifest:
+        with open(manifest) as infile:
+            for line in infile:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    paths.append(line)
+    if directory:
+        paths.extend(sorted(glob.glob(os.path.join(directory, '*.xml')) +
+                            glob.glob(os.path.join(directory, '*.xml.gz'))))
+    return paths
+
+
+def stressor_id(path):
+    ''' METHOD: the name of a stressor file without folder and extensions (XX of output-XX.tsv)
+    '''
+    return os.path.basename(path).split(".")[0]
+
+
+def run_stressor(path, list_events, options, results_dir, outputtype, cache_path=None, cache_size=1024,
+                 profile=False):
+    ''' METHOD: process the abstracts of one stressor and write its output and resume files
+    ARGUMENTS: path -> the PubMed XML file of the stressor
+               list_events, options -> see create_collection_event.load_events and pipeline.make_options
+               results_dir -> the folder of the output-XX.tsv and resume-XX.tsv files
+               outputtype -> see compute_output.open_outputs
+               cache_path, cache_size -> the cache of preprocessed abstracts (see preprocess_cache)
+               profile -> profile the stressor with cProfile (profile-XX.pstats in the results folder)
+    RETURN: stats -> a dictionnary with the name of the stressor, its resume, the cache statistics,
+                     the scoring counters (see compute_scores.scoring_counters) and the record of its
+                     timers and counters (see profiling.run_record)
+    '''
+    name = stressor_id(path)
+    profiler = profiling.start_profile() if profile else None
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    # the timers and counters of this stressor only
+    profiling.take()
+    before = dict(cscores.scoring_counters)
+    stream = cout.open_stream(os.path.join(results_dir, "output-" + name), outputtype, list_events,
+                              os.path.join(results_dir, "resume-" + name + ".tsv"))
+    cache = None
+    if cache_path:
+        # the stressors of the other workers use the same cache file
+        cache = preprocess_cache.open_cache(cache_path, cache_size, shared=True)
+    abstracts = exxml.iter_abstracts_from_pubmedfile(path, options["context_choice"], preprocess=False)
+    abstracts = profiling.timed_iter("parse", abstracts)
+    abstracts = (abstract for abstract in abstracts if not abstract.get('delete'))
+    for abstract in pipeline.process_abstracts(abstracts, list_events, options, cache=cache):
+        cout.write_abstract(stream, abstract)
+    resume = cout.close_stream(stream)
+    stats = {"name": name.replace("-", " "), "resume": resume, "cache": "",
+             "scoring": {key: value - before[key] for key, value in cscores.scoring_counters.items()}}
+    cache_stats = {}
+    if cache is not None:
+        preprocess_cache.close_cache(cache)
+        stats["cache"] = preprocess_cache.stats_line(cache)
+        cache_stats = {key: cache[key] for key in ("hits", "misses", "evictions")}
+    snapshot = profiling.take()
+    snapshot["counters"].update(stats["scoring"])
+    stats["record"] = profiling.run_record(snapshot, stressor=stats["name"], abstracts_file=path,
+                                           abstracts=resume["abstracts"], events=len(list_events),
+                                           wall=time.perf_counter() - wall, cpu=time.process_time() - cpu,
+                                           cache=cache_stats)
+    profiling.stop_profile(profiler, os.path.join(results_dir, "profile-" + name + ".pstats"))
+    return stats
+
+
+def stats_line(stats):
+    ''' METHOD: the line of a stressor in the consolidated stats.txt: name, number of abstracts,
+                number of abstracts with at least one link and number of links
+    '''
+    resume = stats["resume"]
+    return "{}\t{}\t{}\t{}{}\n".format(stats["name"], resume["abstracts"], resume["abstracts_with_link"],
+                                      resume["links"], stats["cache"])
+
+
+# state of a worker process, set once by _init_worker
+_worker_state = None
+
+
+def _init_worker(state):
+    global _worker_state
+    # a worker of the pool cannot start the processes of nlp.pipe
+    _worker_state = dict(state, options=dict(state["options"], spacy_n_process=1))
+    tm.init_tools(lemma=state["options"]["res_filter"])
+    # a forked worker starts with the timers and counters of the main process
+    profiling.take()
+
+
+def _run_in_worker(path):
+    state = _worker_state
+    return run_stressor(path, state["list_events"], state["options"], state["results_dir"],
+                        state["outputtype"], state["cache_path"], state["cache_size"], state["profile"])
+
+
+def run_batch(paths, list_events, options, results_dir, outputtype, workers=1, cache_path=None, cache_size=1024,
+              profile=False):
+    ''' METHOD: run every stressor, one stressor per worker at a time
+    RETURN: a generator of the stats of the stressors (see run_stressor), in the order of paths
+    '''
+    os.makedirs(results_dir, exist_ok=True)
+    state = {"list_events": list_events, "options": options, "results_dir": results_dir,
+             "outputtype": outputtype, "cache_path": cache_path, "cache_size": cache_size, "profile": profile}
+    if workers <= 1:
+        for path in paths:
+            yield run_stressor(path, list_events, options, results_dir, outputtype, cache_path, cache_size, profile)
+        return
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(state,)) as pool:
+        for stats in pool.imap(_run_in_worker, paths):
+            yield stats
+
+
+def dedup_key(abstract):
+    ''' METHOD: an abstract is identified by its PMID and a hash of its text (a PMID revised between the
+                downloads of two stressor files is scored twice)
+    '''
+    return abstract['pmid'], hashlib.sha1(abstract['abstractfull'].encode('utf-8')).digest()
+
+
+def output_fields(abstract, with_text):
+    ''' METHOD: the fields of an abstract the outputs need (its text only if it has a link)
+    '''
+    fields = {'pmid': abstract['pmid'], 'title': abstract['title'], 'pubdate': abstract['pubdate']}
+    if with_text:
+        fields['abstractfull'] = abstract['abstractfull']
+    return fields
+
+
+def run_dedup(paths, list_events, options, results_dir, outputtype, workers=1, cache_path=None, cache_size=1024):
+    ''' METHOD: run every stressor, scoring once the abstracts found in several stressor files
+    ARGUMENTS: see run_batch; workers -> the number of processes scoring the abstracts
+    RETURN: stats, dedup -> the list of the stats of the stressors (name, resume and cache, see run_stressor),
+                            in the order of paths, and the counters of the deduplication (abstracts of every
+                            stressor, unique abstracts scored, abstracts not scored again)
+    '''
+    os.makedirs(results_dir, exist_ok=True)
+    # dedup_key -> names of the events linked to the abstract (empty without link): only what the
+    # outputs and resume read is kept, the outputs of a stressor are written while its file is read
+    scores = {}
+    dedup = {"abstracts": 0, "unique": 0}
+    cache = None
+    if cache_path:
+        cache = preprocess_cache.open_cache(cache_path, cache_size)
+    # the workers are started once for all the stressors
+    pool = pipeline.open_pool(list_events, options, workers) if workers > 1 else None
+    all_stats = []
+    try:
+        for path in paths:
+            name = stressor_id(path)
+            if cache is not None:
+                cache_before = {key: cache[key] for key in ("hits", "misses", "evictions")}
+            stream = cout.open_stream(os.path.join(results_dir, "output-" + name), outputtype, list_events,
+                                      os.path.join(results_dir, "resume-" + name + ".tsv"))
+            # the abstracts of the file being scored, in order, as (fields, key, scored here); the ones
+            # already scored wait here (with the fields of the outputs only) until the abstracts before
+            # them come back from the scoring
+            waiting = collections.deque()
+            in_flight = set()
+
+            def to_score():
+                abstracts = exxml.iter_abstracts_from_pubmedfile(path, options["context_choice"], preprocess=False)
+                for abstract in profiling.timed_iter("parse", abstracts):
+                    if abstract.get('delete'):
+                        continue
+                    key = dedup_key(abstract)
+                    if key not in scores and key not in in_flight:
+                        waiting.append((None, key, True))
+                        in_flight.add(key)
+                        yield abstract
+                    elif waiting:
+                        waiting.append((output_fields(abstract, key in in_flight or scores[key]), key, False))
+                    else:
+                        # nothing before it is being scored
+                        write_known(output_fields(abstract, scores[key]), key)
+
+            def write_known(abstract, key):
+                if scores[key]:
+                    abstract['score'] = dict.fromkeys(scores[key])
+                cout.write_abstract(stream, abstract)
+
+            def write_waiting():
+                # the abstracts already scored, up to the next one being scored
+                while waiting and not waiting[0][2]:
+                    abstract, key, __ = waiting.popleft()
+                    write_known(abstract, key)
+
+            for abstract in pipeline.process_abstracts(to_score(), list_events, options, workers,
+                                                       cache=cache, pool=pool):
+                write_waiting()
+                __, key, __ = waiting.popleft()
+                in_flight.discard(key)
+                scores[key] = tuple(abstract.get('score', ()))
+                dedup["unique"] += 1
+                cout.write_abstract(stream, abstract)
+            write_waiting()
+            resume = cout.close_stream(stream)
+            dedup["abstracts"] += resume["abstracts"]
+            stats = {"name": name.replace("-", " "), "resume": resume, "cache": ""}
+            if cache is not None:
+                # the lookups of the abstracts of this stressor only
+                stats["cache"] = preprocess_cache.stats_line(
+                    {key: cache[key] - value for key, value in cache_before.items()})
+            all_stats.append(stats)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    if cache is not None:
+        preprocess_cache.close_cache(cache)
+    dedup["saved"] = dedup["abstracts"] - dedup["unique"]
+    return all_stats, dedup
+
+
+def dedup_line(dedup):
+    ''' METHOD: the work saved by the deduplication of the abstracts
+    '''
+    rate = dedup["saved"] / dedup["abstracts"] if dedup["abstracts"] else 0.0
+    return "dedup\tabstracts {}\tunique {}\tsaved {}\tsaved_rate {:.3f}\n".format(
+        dedup["abstracts"], dedup["unique"], dedup["saved"], rate)
+
+
+def main_dedup(args, paths, list_events, options, stats_path):
+    profiler = profiling.start_profile() if args.profile else None
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    profiling.take()
+    all_stats, dedup = run_dedup(paths, list_events, options, args.results, args.outputtype, args.workers,
+                                 args.cache, args.cache_size)
+    with open(stats_path, "a") as stats_file:
+        for stats in all_stats:
+            stats_file.write(stats_line(stats))
+            print(stats["name"] + "   " + str(stats["resume"]["abstracts"]))
+    snapshot = profiling.take()
+    snapshot["counters"].update(cscores.scoring_counters)
+    record = profiling.run_record(snapshot, stressor=[stats["name"] for stats in all_stats], abstracts_file=paths,
+                                  abstracts=dedup["abstracts"], events=len(list_events),
+                                  wall=time.perf_counter() - wall, cpu=time.process_time() - cpu, dedup=dedup)
+    profiling.write_record(profiling.sidecar_path(stats_path), record)
+    profiling.stop_profile(profiler, os.path.join(args.results, "profile-dedup.pstats"))
+    sys.stderr.write(dedup_line(dedup))
+
+
+def main(args):
+    start_time = time.time()
+    paths = stressor_files(args.manifest, args.dir)
+    options = pipeline.make_options(args.intro, args.cleaning, args.spacy_batch_size)
+    # the events are preprocessed once for all the stressors
+    list_events = ev.load_events(args.events, options, args.events_bundle)
+    stats_path = args.stats or os.path.join(args.results, "stats.txt")
+    os.makedirs(args.results, exist_ok=True)
+    if args.dedup:
+        main_dedup(args, paths, list_events, options, stats_path)
+        sys.stderr.write("total\t{:.3f}s\n".format(time.time() - start_time))
+        tm.report_timings()
+        cscores.report_pruning()
+        return
+    # the stressors may be scored by other processes
+    scoring = dict.fromkeys(cscores.scoring_counters, 0)
+    with open(stats_path, "a") as stats_file:
+        for stats in run_batch(paths, list_events, options, args.results, args.outputtype,
+                               args.workers, args.cache, args.cache_size, args.profile):
+            for key, value in stats["scoring"].items():
+                scoring[key] += value
+            stats_file.write(stats_line(stats))
+            profiling.write_record(profiling.sidecar_path(stats_path), stats["record"])
+            stats_file.flush()
+            print(stats["name"] + "   " + str(stats["resume"]["abstracts"]))
+    sys.stderr.write("total\t{:.3f}s\n".format(time.time() - start_time))
+    tm.report_timings()
+    cscores.scoring_counters.update(scoring)
+    cscores.report_pruning()
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--manifest", type=str, help="file with one abstracts file (pubmed xml) per line")
+parser.add_argument("--dir", type=str, help="folder of abstracts files (pubmed xml)")
+parser.add_argument("--events", type=str, help="events file")
+parser.add_argument("--results", type=str, default="results", help="folder of the output and resume files")
+parser.add_argument("--stats", type=str, help="stats file (default: stats.txt in the results folder)")
+parser.add_argument("--outputtype", type=str)
+parser.add_argument("--cleaning", type=str)
+parser.add_argument("--intro", type=int)
+parser.add_argument("--workers", type=int, default=1,
+                    help="number of stressors processed in parallel (with --dedup: processes scoring the abstracts)")
+parser.add_argument("--dedup", action="store_true",
+                    help="score once the abstracts found in several stressor files")
+parser.add_argument("--spacy_batch_size", type=int, default=256, help="batch size of the lemmatisation (nlp.pipe)")
+parser.add_argument("--events_bundle", type=str, help="compiled events file (default: events file + .<options key>.bundle)")
+parser.add_argument("--profile", action="store_true", help="profile every stressor with cProfile (profile-XX.pstats; with --dedup: profile-dedup.pstats)")
+parser.add_argument("--cache", type=str, help="cache file of the preprocessed abstracts (SQLite)")
+parser.add_argument("--cache_size", type=int, default=1024, help="maximal size of the cache, in MB")
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
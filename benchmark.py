@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+#authors: Florence Jornod - INSERM UMRS 1124
+#         Thomas Jaylet - Université de Paris - France
+#         Karine Audouze - Université de Paris - France
+
+#contact: systox@paris-descartes.fr
+
+
+#AOP-helpFinder is provided without any warranty. But if you have any probleme please feel free to contact us by mail.
+
+#------- WHAT IS AOPHELPFINDER? -------------
+
+#AOP-helpFinder is a tool developed to help AOP development (Jean-Charles Carvaillo: https://github.com/jecarvaill/aop-helpFinder)(Environ Health Perspect. 2019 Apr;127(4):47005).
+
+#It is based on text mining and parsing process on scientific abstracts. AOP-helpFinder identify links between stressors and molecular initiating event, key events and adverse outcomes through abstracts from the PubMed database (https://pubmed.ncbi.nlm.nih.gov/).
+
+#AOP-helpFinder was implemented under the H2020 Human Biomonintoring in Europe (HBM4EU) project, Work Package 13.1.
+#HBM4EU has received funding from the European Union’s H2020 research and innovation programme under grant agreement No 733032.
+
+#------- LICENCE ---------------------------
+
+#This software is governed by the CeCILL license under French law and abiding by the rules of distribution of free software.  You can  use,  modify and/ or redistribute the software under the terms of the CeCILL license as circulated by CEA, CNRS and INRIA at the following URL
+
+#http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
+#-------------------------------------------
+"""
+Benchmark of the pipeline on a synthetic corpus (no network needed).
+
+A PubMed XML file of --abstracts abstracts and an events csv of --events
+events are generated from --seed in --workdir (and reused by the runs with
+the same sizes and seed), then every stage is timed separately (wall and
+CPU time):
+
+    events          read and preprocess the events (create_collection_event)
+    parse           parse the XML (extract_xml_withpmid, without text mining)
+    clean_abstract  stem and full views of the abstracts (preprocess_article)
+    compute_scores  scores of every abstract
+    results_filter  lemmatisation and filter (with --cleaning cleaning-yes)
+    output          tsv, tsv with abstracts and txt outputs, and resume
+
+The report gives the abstracts/s of the whole run, the peak RSS and the
+breakdown per stage. With --baseline, every stage is compared to a previous
+report (written with --save_baseline) and the run fails (exit code 1) if a
+stage is slower than the baseline by more than --tolerance.
+
+    python benchmark.py --abstracts 2000 --events 500 --cleaning cleaning-yes \
+        --save_baseline bench_baseline.json
+    python benchmark.py --abstracts 2000 --events 500 --cleaning cleaning-yes \
+        --baseline bench_baseline.json
+
+With --writers, only the writers of compute_output are timed, on --abstracts
+scored abstracts (3 links each) and --events events given as a plain list
+and as an EventCollection, and the run fails if their outputs differ.
+
+    python benchmark.py --writers --abstracts 20000 --events 1500
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+from xml.sax.saxutils import escape
+import extract_xml_withpmid as exxml
+import compute_output as cout
+import compute_scores as cscores
+import create_collection_event as ev
+import pipeline
+import profiling
+import results_filter as rf
+import tm_module as tm
+from event_collection import EventCollection
+
+STAGES = ["events", "parse", "clean_abstract", "compute_scores", "results_filter", "output"]
+
+# words of the synthetic abstracts and events
+VOCABULARY = ["mitochondrial", "dysfunction", "oxidative", "stress", "apoptosis", "liver", "fibrosis",
+              "cell", "death", "inflammation", "receptor", "activation", "estrogen", "androgen", "thyroid",
+              "hormone", "expression", "gene", "protein", "kidney", "injury", "neurotoxicity", "obesity",
+              "insulin", "resistance", "dna", "damage", "reproductive", "toxicity", "steatosis", "lipid",
+              "accumulation", "proliferation", "tumor", "growth", "signaling", "pathway", "exposure",
+              "mice", "rats", "zebrafish", "human", "cells", "level", "dose", "response", "chronic", "acute"]
+VERBS = ["increased", "decreased", "induced", "reduced", "inhibited", "altered", "promoted"]
+FILLERS = ["the", "of", "and", "in", "a", "was", "were", "by", "with", "after", "to"]
+MODALS = ["may", "might", "could"]
+
+
+def synthetic_sentence(rng):
+    words = []
+    for i in range(rng.randint(8, 25)):
+        pick = rng.random()
+        if pick < 0.45:
+            words.append(rng.choice(VOCABULARY))
+        elif pick < 0.6:
+            words.append(rng.choice(VERBS))
+        elif pick < 0.63:
+            words.append(rng.choice(MODALS))
+        else:
+            words.append(rng.choice(FILLERS))
+    return " ".join(words).capitalize() + "."
+
+
+def synthetic_article(pmid, rng):
+    abstract = " ".join(synthetic_sentence(rng) for i in range(rng.randint(4, 12)))
+    title = synthetic_sentence(rng)
+    return ('<PubmedArticle><MedlineCitation Status="MEDLINE" Owner="NLM"><PMID Version="1">{pmid}</PMID>'
+            '<Article><Journal><Title>Synthetic journal</Title><JournalIssue><PubDate><Year>{year}</Year>'
+            '</PubDate></JournalIssue></Journal><ArticleTitle>{title}</ArticleTitle><Abstract>'
+            '<AbstractText>{abstract}</AbstractText></Abstract></Article><KeywordList>'
+            '<Keyword>{keyword}</Keyword></KeywordList></MedlineCitation><PubmedData><ArticleIdList>'
+            '<ArticleId IdType="pubmed">{pmid}</ArticleId></ArticleIdList></PubmedData></PubmedArticle>'
+            ).format(pmid=pmid, year=rng.randint(1990, 2023), title=escape(title),
+                     abstract=escape(abstract), keyword=rng.choice(VOCABULARY))
+
+
+def write_corpus(path, nb_abstracts, seed=0):
+    ''' METHOD: write a synthetic PubMed XML file
+    '''
+    rng = random.Random(seed)
+    with open(path, "w") as outfile:
+        outfile.write('<?xml version="1.0" encoding="utf-8"?>\n<PubmedArticleSet>\n')
+        for i in range(nb_abstracts):
+            outfile.write(synthetic_article(10000000 + i, rng) + "\n")
+        outfile.write('</PubmedArticleSet>\n')
+
+
+def write_events(path, nb_events, seed=0):
+    ''' METHOD: write a synthetic events csv (one event name per line, as the AOP-wiki events)
+    '''
+    rng = random.Random(seed + 1)
+    names = []
+    seen = set()
+    while len(names) < nb_events:
+        words = rng.sample(VOCABULARY, rng.randint(1, 4))
+        if rng.random() < 0.2:
+            words.insert(0, rng.choice(VERBS))
+        name = " ".join(words)
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    with open(path, "w") as outfile:
+        for name in names:
+            outfile.write(name + "\n")
+
+
+def run_benchmark(abstracts_file, events_file, options, output_dir):
+    ''' METHOD: run the pipeline stage by stage on a corpus and time every stage
+    RETURN: report -> a dictionnary with the timings of every stage, the abstracts/s and the peak RSS
+    '''
+    timings = {}
+
+    def timed(stage, function):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        result = function()
+        timings[stage] = {"wall": time.perf_counter() - wall, "cpu": time.process_time() - cpu}
+        return result
+
+    start = time.perf_counter()
+    tm.init_tools(lemma=options["res_filter"])
+    # the events are compiled without bundle, so that they are preprocessed in the benchmark
+    list_events = timed("events", lambda: ev.prepare_events(ev.create_collection_event(events_file), options))
+    abstracts = timed("parse", lambda: [abstract for abstract in
+                                        exxml.iter_abstracts_from_pubmedfile(abstracts_file, options["context_choice"],
+                                                                             preprocess=False)
+                                        if not abstract.get('delete')])
+
+    def clean():
+        for abstract in abstracts:
+            exxml.preprocess_article(abstract, options["context_choice"])
+    timed("clean_abstract", clean)
+
+    def score():
+        for abstract in abstracts:
+            scores = cscores.compute_scores(abstract, list_events, options["intro"])
+            if scores:
+                abstract['score'] = scores
+    timed("compute_scores", score)
+
+    def filter_results():
+        if options["res_filter"] is True:
+            rf.results_filter(abstracts, list_events, options["lemma_supp"], options["modal_supp"],
+                              options["modulateur_supp"], options["context_choice"],
+                              options["spacy_batch_size"], options["spacy_n_process"])
+    timed("results_filter", filter_results)
+
+    def output():
+        stream = cout.open_stream(os.path.join(output_dir, "output-benchmark"), "tsv,tsv_abstracts,txt_format",
+                                  list_events, os.path.join(output_dir, "resume-benchmark.tsv"))
+        for abstract in abstracts:
+            cout.write_abstract(stream, abstract)
+        return cout.close_stream(stream)
+    resume = timed("output", output)
+
+    total = time.perf_counter() - start
+    return {"abstracts": len(abstracts),
+            "events": len(list_events),
+            "links": resume["links"],
+            "total": total,
+            "abstracts_per_s": len(abstracts) / total if total else 0.0,
+            "peak_rss_mb": profiling.peak_rss_mb(),
+            "stages": timings}
+
+
+def synthetic_results(nb_events, nb_abstracts, hits_per_abstract, rng):
+    ''' METHOD: scored abstracts with hits_per_abstract links each, for the writers of compute_output
+    RETURN: list_events, dict_abstracts
+    '''
+    list_events = [{"id": "KE {}".format(i), "name": "KE {}".format(i)} for i in range(nb_events)]
+    dict_abstracts = []
+    for i in range(nb_abstracts):
+        events = rng.sample(list_events, hits_per_abstract)
+        dict_abstracts.append({'title': "title {}".format(i), 'pmid': str(i), 'pubdate': "2020",
+                               'abstractfull': "sentence one.\nsentence two.", 'keywords': "",
+                               'score': {event["name"]: {} for event in events}})
+    return list_events, dict_abstracts
+
+
+def run_writers(nb_events, nb_abstracts, seed=0, output=sys.stdout):
+    ''' METHOD: time the writers of compute_output with a plain list and with an EventCollection
+    RETURN: identical -> True if the outputs are the same with both
+    '''
+    list_events, dict_abstracts = synthetic_results(nb_events, nb_abstracts, 3, random.Random(seed))
+    collection = EventCollection(list_events)
+    identical = True
+    for write in (cout.results_to_tsv, cout.results_abstracts_to_tsv, cout.results_abstracts_txt):
+        timings = []
+        outputs = []
+        for events in (list_events, collection):
+            buffer = io.StringIO()
+            t0 = time.perf_counter()
+            write(dict_abstracts, buffer, events)
+            timings.append(time.perf_counter() - t0)
+            outputs.append(buffer.getvalue())
+        identical = identical and outputs[0] == outputs[1]
+        output.write("{}\tlist {:.3f}s\tEventCollection {:.3f}s\tidentical {}\n".format(
+            write.__name__, timings[0], timings[1], outputs[0] == outputs[1]))
+    return identical
+
+
+def compare(report, baseline, tolerance):
+    ''' METHOD: compare the wall times of a report with a baseline report
+    RETURN: regressions -> the list of the stages slower than the baseline by more than tolerance
+    '''
+    regressions = []
+    for stage in STAGES + ["total"]:
+        if stage == "total":
+            now, before = report["total"], baseline.get("total")
+        else:
+            now = report["stages"][stage]["wall"]
+            before = baseline.get("stages", {}).get(stage, {}).get("wall")
+        if not before:
+            continue
+        ratio = now / before
+        if ratio > 1 + tolerance:
+            regressions.append(stage)
+        report.setdefault("compared", {})[stage] = ratio
+    return regressions
+
+
+def print_report(report, output=sys.stdout):
+    output.write("abstracts\t{}\nevents\t{}\nlinks\t{}\n".format(report["abstracts"], report["events"],
+                                                               report["links"]))
+    output.write("total\t{:.3f}s\nabstracts/s\t{:.1f}\n".format(report["total"], report["abstracts_per_s"]))
+    if report["peak_rss_mb"] is not None:
+        output.write("peak_rss\t{:.1f} MB\n".format(report["peak_rss_mb"]))
+    output.write("stage\twall\tcpu\tshare\tvs baseline\n")
+    for stage in STAGES:
+        timing = report["stages"][stage]
+        share = timing["wall"] / report["total"] if report["total"] else 0.0
+        ratio = report.get("compared", {}).get(stage)
+        output.write("{}\t{:.3f}s\t{:.3f}s\t{:.1%}\t{}\n".format(stage, timing["wall"], timing["cpu"], share,
+                                                              "" if ratio is None else "x{:.2f}".format(ratio)))
+
+
+def main(args):
+    if args.writers:
+        sys.exit(0 if run_writers(args.events, args.abstracts, args.seed) else 1)
+    os.makedirs(args.workdir, exist_ok=True)
+    abstracts_file = os.path.join(args.workdir, "benchmark-{}-seed{}.xml".format(args.abstracts, args.seed))
+    events_file = os.path.join(args.workdir, "events-{}-seed{}.csv".format(args.events, args.seed))
+    if not os.path.exists(abstracts_file):
+        write_corpus(abstracts_file, args.abstracts, args.seed)
+    if not os.path.exists(events_file):
+        write_events(events_file, args.events, args.seed)
+    options = pipeline.make_options(args.intro, args.cleaning, args.spacy_batch_size)
+    report = run_benchmark(abstracts_file, events_file, options, args.workdir)
+    report["parameters"] = {"abstracts": args.abstracts, "events": args.events, "cleaning": args.cleaning,
+                            "intro": args.intro, "seed": args.seed}
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+        if baseline.get("parameters") != report["parameters"]:
+            sys.stderr.write("warning: the baseline was run with other parameters: {}\n".format(
+                baseline.get("parameters")))
+        regressions = compare(report, baseline, args.tolerance)
+    print_report(report)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as outfile:
+            json.dump(report, outfile, indent=1)
+    if regressions:
+        sys.stderr.write("regression (more than {:.0%} slower): {}\n".format(args.tolerance, ", ".join(regressions)))
+        sys.exit(1)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--abstracts", type=int, default=1000, help="number of synthetic abstracts")
+parser.add_argument("--events", type=int, default=200, help="number of synthetic events")
+parser.add_argument("--cleaning", type=str, default="cleaning-yes")
+parser.add_argument("--intro", type=int, default=20)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--spacy_batch_size", type=int, default=256, help="batch size of the lemmatisation (nlp.pipe)")
+parser.add_argument("--workdir", type=str, default="benchmark", help="folder of the synthetic corpus and outputs")
+parser.add_argument("--baseline", type=str, help="report of a previous run (json) to compare with")
+parser.add_argument("--save_baseline", type=str, help="write the report of this run (json)")
+parser.add_argument("--tolerance", type=float, default=0.2, help="accepted slowdown of a stage (0.2 = 20%%)")
+parser.add_argument("--writers", action="store_true",
+                    help="only compare the writers of compute_output with a list and an EventCollection")
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+#authors: Florence Jornod - INSERM UMRS 1124
+#         Thomas Jaylet - Université de Paris - France
+#         Karine Audouze - Université de Paris - France
+
+#contact: systox@paris-descartes.fr
+
+
+#AOP-helpFinder is provided without any warranty. But if you have any probleme please feel free to contact us by mail.
+
+#------- WHAT IS AOPHELPFINDER? -------------
+
+#AOP-helpFinder is a tool developed to help AOP development (Jean-Charles Carvaillo: https://github.com/jecarvaill/aop-helpFinder)(Environ Health Perspect. 2019 Apr;127(4):47005).
+
+#It is based on text mining and parsing process on scientific abstracts. AOP-helpFinder identify links between stressors and molecular initiating event, key events and adverse outcomes through abstracts from the PubMed database (https://pubmed.ncbi.nlm.nih.gov/).
+
+#AOP-helpFinder was implemented under the H2020 Human Biomonintoring in Europe (HBM4EU) project, Work Package 13.1.
+#HBM4EU has received funding from the European Union’s H2020 research and innovation programme under grant agreement No 733032.
+
+#------- LICENCE ---------------------------
+
+#This software is governed by the CeCILL license under French law and abiding by the rules of distribution of free software.  You can  use,  modify and/ or redistribute the software under the terms of the CeCILL license as circulated by CEA, CNRS and INRIA at the following URL
+
+#http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
+#-------------------------------------------
+"""
+Chunked and resumable runs on large corpora.
+
+The abstracts of a stressor are processed by chunks of --chunk_size
+abstracts; the results and counters of each chunk are written atomically
+(temporary file then rename) in the checkpoint folder:
+
+    checkpoint.json         parameters of the run (hash of the abstracts file and
+                            of the events file, options, chunk size)
+    chunk-00000.jsonl.gz    one line with the counters of the chunk, then one
+                            line per abstract (pmid, title, pubdate, abstract, score)
+    chunks.json             number of chunks, written when the end of the
+                            abstracts file is reached
+
+A run started again skips the chunks already written. Several machines
+sharing the folder can process the chunks of the same run with --shard i/n
+(chunk k is processed by the machine k % n). The merge then writes the usual
+outputs, resume and stats line from the chunks, in the order of the file.
+The files are identified by their content, not their path, so the folder can
+be used from machines where they are at other places.
+
+    python checkpoint.py run --abst bisphenol-a.xml --events events.csv \
+        --checkpoint ckpt-bisphenol-a --cleaning cleaning-yes --intro 20 [--shard 0/2]
+    python checkpoint.py merge --checkpoint ckpt-bisphenol-a --output output-bisphenol-a \
+        --outputtype tsv --resume resume-bisphenol-a.tsv --stats stats.txt [--events events.csv]
+"""
+import argparse
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+import extract_xml_withpmid as exxml
+import compute_output as cout
+import compute_scores as cscores
+import create_collection_event as ev
+import pipeline
+import tm_module as tm
+
+CHECKPOINT_VERSION = 2
+# fields of the manifest which must be the same to continue a run (the paths are only informative)
+SAME_RUN = ('version', 'abstracts_hash', 'events_hash', 'options', 'chunk_size')
+# fields of an abstract kept in a chunk (what the outputs need)
+FIELDS = ('pmid', 'title', 'pubdate', 'abstractfull', 'score')
+
+
+def _write_atomic(path, data):
+    tmp_path = "{}.tmp-{}".format(path, os.getpid())
+    with open(tmp_path, "wb") as outfile:
+        outfile.write(data)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace(tmp_path, path)
+
+
+def _file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as infile:
+        for block in iter(lambda: infile.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_path(directory, idx):
+    return os.path.join(directory, "chunk-{:05d}.jsonl.gz".format(idx))
+
+
+def open_checkpoint(directory, abstracts_file, events_file, options, chunk_size):
+    ''' METHOD: create the checkpoint folder of a run, or check that an existing one is for the same run
+    RETURN: manifest -> the parameters of the run (checkpoint.json)
+    Raise ValueError if the folder was created for another run
+    '''
+    os.makedirs(directory, exist_ok=True)
+    manifest = {"version": CHECKPOINT_VERSION,
+                "abstracts_file": os.path.abspath(abstracts_file),
+                "abstracts_hash": _file_hash(abstracts_file),
+                "events_file": os.path.abspath(events_file),
+                "events_hash": _file_hash(events_file),
+                "options": {key: value for key, value in options.items() if not key.startswith("spacy_")},
+                "chunk_size": chunk_size}
+    path = os.path.join(directory, "checkpoint.json")
+    if os.path.exists(path):
+        with open(path) as infile:
+            stored = json.load(infile)
+        if any(stored.get(key) != manifest[key] for key in SAME_RUN):
+            raise ValueError("the checkpoint {} was created for another run".format(directory))
+        manifest = stored
+    else:
+        _write_atomic(path, json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8"))
+    return manifest
+
+
+def load_manifest(directory):
+    with open(os.path.join(directory, "checkpoint.json")) as infile:
+        return json.load(infile)
+
+
+def check_events(manifest, events_file):
+    ''' METHOD: check that an events file is the one the chunks were scored with
+    Raise ValueError if it is not
+    '''
+    if _file_hash(events_file) != manifest["events_hash"]:
+        raise ValueError("the events file {} is not the one of the run ({})".format(events_file,
+                                                                                   manifest["events_file"]))
+
+
+def write_chunk(directory, idx, abstracts):
+    ''' METHOD: write the processed abstracts of a chunk, with its counters, atomically
+    '''
+    resume = cout.new_resume()
+    lines = []
+    for abstract in abstracts:
+        cout.update_resume(resume, abstract)
+        lines.append(json.dumps({field: abstract[field] for field in FIELDS if field in abstract}))
+    header = {"chunk": idx, "abstracts": len(abstracts), "resume": resume}
+    text = "\n".join([json.dumps(header)] + lines) + "\n"
+    _write_atomic(chunk_path(directory, idx), gzip.compress(text.encode("utf-8")))
+
+
+def read_chunk(directory, idx):
+    ''' METHOD: the counters and the abstracts of a chunk
+    RETURN: header, abstracts -> header is a dictionnary with the number of abstracts and the resume
+    '''
+    with gzip.open(chunk_path(directory, idx), "rt", encoding="utf-8") as infile:
+        header = json.loads(infile.readline())
+        abstracts = [json.loads(line) for line in infile]
+    return header, abstracts
+
+
+def parse_shard(shard):
+    ''' METHOD: "i/n" -> (i, n)
+    '''
+    if not shard:
+        return 0, 1
+    i, n = (int(value) for value in shard.split("/"))
+    if not 0 <= i < n:
+        raise ValueError("the shard must be i/n with 0 <= i < n")
+    return i, n
+
+
+def run_chunks(abstracts, list_events, options, directory, chunk_size, shard=(0, 1), workers=1):
+    ''' METHOD: process the chunks of a run which are not written yet
+    ARGUMENTS: abstracts -> an iterable of abstracts, not preprocessed (preprocess=False)
+               shard -> (i, n): only the chunks k with k % n == i are processed
+    RETURN: counters -> the number of chunks processed, skipped (already written or other shard), and
+                        the total number of chunks
+    '''
+    counters = {"chunks_processed": 0, "chunks_skipped": 0, "chunks": 0}
+    i, n = shard
+    abstracts = (abstract for abstract in abstracts if not abstract.get('delete'))
+    # the workers (and their text mining tools) are started once for all the chunks
+    pool = pipeline.open_pool(list_events, options, workers) if workers > 1 else None
+    try:
+        for idx in itertools.count():
+            chunk = list(itertools.islice(abstracts, chunk_size))
+            if not chunk:
+                break
+            counters["chunks"] += 1
+            if idx % n != i or os.path.exists(chunk_path(directory, idx)):
+                counters["chunks_skipped"] += 1
+                continue
+            processed = list(pipeline.process_abstracts(chunk, list_events, options, workers, pool=pool))
+            write_chunk(directory, idx, processed)
+            counters["chunks_processed"] += 1
+            sys.stderr.write("chunk {}\t{} abstracts\n".format(idx, len(processed)))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    # the end of the file was reached: the number of chunks is known
+    _write_atomic(os.path.join(directory, "chunks.json"),
+                  json.dumps({"chunks": counters["chunks"]}).encode("utf-8"))
+    return counters
+
+
+def missing_chunks(directory):
+    ''' METHOD: the chunks not written yet, None if the number of chunks is not known yet
+    '''
+    path = os.path.join(directory, "chunks.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as infile:
+        nb_chunks = json.load(infile)["chunks"]
+    return [idx for idx in range(nb_chunks) if not os.path.exists(chunk_path(directory, idx))]
+
+
+def merge(directory, list_events, output_filename, outputtype, resume_filename=None):
+    ''' METHOD: write the outputs and the resume of a run from its chunks
+    RETURN: resume -> see compute_output.new_resume
+    Raise ValueError if some chunks are missing
+    '''
+    missing = missing_chunks(directory)
+    if missing is None or missing:
+        raise ValueError("the run is not complete, missing chunks: {}".format(
+            "unknown (the end of the abstracts file was not reached)" if missing is None else missing))
+    path = os.path.join(directory, "chunks.json")
+    with open(path) as infile:
+        nb_chunks = json.load(infile)["chunks"]
+    stream = cout.open_stream(output_filename, outputtype, list_events, resume_filename)
+    for idx in range(nb_chunks):
+        __, abstracts = read_chunk(directory, idx)
+        for abstract in abstracts:
+            cout.write_abstract(stream, abstract)
+    return cout.close_stream(stream)
+
+
+def main_run(args):
+    start_time = time.time()
+    options = pipeline.make_options(args.intro, args.cleaning, args.spacy_batch_size)
+    open_checkpoint(args.checkpoint, args.abst, args.events, options, args.chunk_size)
+    list_events = ev.load_events(args.events, options, args.events_bundle)
+    abstracts = exxml.iter_abstracts_from_pubmedfile(args.abst, options["context_choice"], preprocess=False)
+    counters = run_chunks(abstracts, list_events, options, args.checkpoint, args.chunk_size,
+                          parse_shard(args.shard), args.workers)
+    missing = missing_chunks(args.checkpoint)
+    sys.stderr.write("total\t{:.3f}s\tchunks {}\tprocessed {}\tskipped {}\tmissing {}\n".format(
+        time.time() - start_time, counters["chunks"], counters["chunks_processed"],
+        counters["chunks_skipped"], len(missing)))
+    tm.report_timings()
+    cscores.report_pruning()
+
+
+def main_merge(args):
+    manifest = load_manifest(args.checkpoint)
+    options = dict(manifest["options"])
+    options.update(spacy_batch_size=args.spacy_batch_size, spacy_n_process=1)
+    # the events file of the run, or the same file at another place
+    events_file = args.events or manifest["events_file"]
+    check_events(manifest, events_file)
+    list_events = ev.load_events(events_file, options, args.events_bundle)
+    resume = merge(args.checkpoint, list_events, args.output, args.outputtype, args.resume)
+    name = os.path.basename(manifest["abstracts_file"]).split(".")[0].replace("-", " ")
+    if args.stats:
+        with open(args.stats, "a") as stats_file:
+            stats_file.write("{}\t{}\t{}\t{}\n".format(name, resume["abstracts"], resume["abstracts_with_link"],
+                                                       resume["links"]))
+    print(manifest["abstracts_file"] + "   " + str(resume["abstracts"]))
+
+
+def main(args):
+    try:
+        if args.command == "run":
+            main_run(args)
+        else:
+            main_merge(args)
+    except ValueError as error:
+        sys.stderr.write("error: {}\n".format(error))
+        sys.exit(1)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("command", choices=["run", "merge"])
+parser.add_argument("--checkpoint", type=str, help="checkpoint folder of the run")
+# run
+parser.add_argument("--abst", type=str, help="run: abstracts file (pubmed xml)")
+parser.add_argument("--events", type=str,
+                    help="events file (merge: default the one of the run, which must not have changed)")
+parser.add_argument("--cleaning", type=str)
+parser.add_argument("--intro", type=int)
+parser.add_argument("--chunk_size", type=int, default=1000, help="run: number of abstracts of a chunk")
+parser.add_argument("--shard", type=str, help="run: i/n, process only the chunks k with k %% n == i")
+parser.add_argument("--workers", type=int, default=1, help="run: number of processes used to score a chunk")
+parser.add_argument("--spacy_batch_size", type=int, default=256, help="batch size of the lemmatisation (nlp.pipe)")
+parser.add_argument("--events_bundle", type=str, help="compiled events file (default: events file + .<options key>.bundle)")
+# merge
+parser.add_argument("--output", type=str, help="merge: output file")
+parser.add_argument("--outputtype", type=str)
+parser.add_argument("--resume", type=str, help="merge: resume file (resume-XX.tsv), optional")
+parser.add_argument("--stats", type=str, help="merge: stats file, optional")
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
@@ -25,10 +25,230 @@
 # http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
 
 
+import io
+import queue
+import threading
 import nltk.corpus
 import nltk.stem
 from nltk.tokenize import sent_tokenize
 from nltk import word_tokenize
+from event_collection import events_named
+import profiling
+
+# size of the text kept in memory for each output file before one bulk write
+FLUSH_SIZE = 1 << 20
+# number of abstracts waiting for the writer thread of a stream
+QUEUE_SIZE = 256
+
+def output_files(filename, outputtype):
+    """ the files of an output type and the functions writing one abstract into them
+    ARGUMENTS : filename -> the name of the output files, without extension
+    outputtype -> "tsv_abstracts", "txt_format" or anything else for the default tsv; several types
+    can be given separated by commas (the tsv with the abstracts is then filename_abstracts.tsv)
+    RETURN : files -> a list of (function writing one abstract, path), without duplicates
+    """
+    types = outputtype.split(",") if outputtype else [outputtype]
+    files = []
+    for one_type in types:
+        if(one_type=="tsv_abstracts"):
+            path = filename+".tsv" if len(types) == 1 else filename+"_abstracts.tsv"
+            new_files = [(abstract_to_tsv_full, path)]
+        elif(one_type=="txt_format"):
+            new_files = [(abstract_to_txt, filename+".txt"), (abstract_to_tsv, filename+".tsv")]
+        else:
+            new_files = [(abstract_to_tsv, filename+".tsv")]
+        for new_file in new_files:
+            if new_file not in files:
+                files.append(new_file)
+    return files
+
+def open_outputs(filename, outputtype):
+    """ open the output files of a run and write their header
+    ARGUMENTS : see output_files
+    RETURN : writers -> a list of (function writing one abstract, file)
+    """
+    writers = [(write, open(path, "w", buffering=FLUSH_SIZE)) for write, path in output_files(filename, outputtype)]
+    for __, output_file in writers:
+        write_header(output_file)
+    return writers
+
+def close_outputs(writers):
+    """ close the files opened by open_outputs
+    """
+    for __, output_file in writers:
+        output_file.close()
+    return
+
+def _write_buffered(stream, abstract):
+    update_resume(stream["resume"], abstract)
+    for write, __, buffer in stream["writers"]:
+        write(abstract, buffer, stream["list_events"])
+    stream["pending"] += 1
+    if stream["pending"] >= stream["flush_every"]:
+        _flush(stream)
+
+def _flush(stream):
+    for __, output_file, buffer in stream["writers"]:
+        text = buffer.getvalue()
+        if text:
+            output_file.write(text)
+            buffer.seek(0)
+            buffer.truncate()
+    stream["pending"] = 0
+
+def _writer_thread(stream):
+    try:
+        while True:
+            abstract = stream["queue"].get()
+            if abstract is None:
+                break
+            # the formatting and writing are timed here, not in the producer
+            with profiling.stage("output", thread=True):
+                _write_buffered(stream, abstract)
+    except BaseException as error:
+        stream["error"] = error
+        # the producer must not stay blocked on a full queue
+        while stream["queue"].get() is not None:
+            pass
+
+def open_stream(filename, outputtype, list_events, resume_filename=None, threaded=True, flush_every=1000):
+    """ open the outputs of a run as a stream: the abstracts are written as they are produced, every
+    output file in the same pass, in bulk writes of flush_every abstracts, and the resume of the stressor
+    is counted along the way
+    ARGUMENTS : filename, outputtype -> see output_files
+    list_events -> the events used
+    resume_filename -> the resume file written by close_stream (resume-XX.tsv), optional
+    threaded -> format and write in a separate thread, while the next abstracts are scored
+    RETURN : stream -> a dictionnary used by write_abstract and close_stream
+    """
+    stream = {"writers": [(write, output_file, io.StringIO()) for write, output_file in open_outputs(filename, outputtype)],
+              "list_events": list_events,
+              "resume": new_resume(),
+              "resume_filename": resume_filename,
+              "flush_every": flush_every,
+              "pending": 0,
+              "queue": None,
+              "thread": None,
+              "error": None}
+    if threaded:
+        stream["queue"] = queue.Queue(QUEUE_SIZE)
+        stream["thread"] = threading.Thread(target=_writer_thread, args=(stream,), daemon=True)
+        stream["thread"].start()
+    return stream
+
+def write_abstract(stream, abstract):
+    """ write one processed abstract into every output of the stream
+    """
+    if stream["error"] is not None:
+        raise stream["error"]
+    if stream["queue"] is None:
+        with profiling.stage("output"):
+            _write_buffered(stream, abstract)
+    else:
+        stream["queue"].put(abstract)
+    return
+
+def close_stream(stream):
+    """ write what is left, close the output files and write the resume file
+    RETURN : resume -> the resume of the stressor (see new_resume)
+    """
+    if stream["thread"] is not None:
+        stream["queue"].put(None)
+        stream["thread"].join()
+    with profiling.stage("output"):
+        try:
+            if stream["error"] is not None:
+                raise stream["error"]
+            _flush(stream)
+        finally:
+            close_outputs([(write, output_file) for write, output_file, __ in stream["writers"]])
+        if stream["resume_filename"]:
+            with open(stream["resume_filename"], "w") as resume_file:
+                results_resume(stream["resume"], resume_file)
+    return stream["resume"]
+
+def new_resume():
+    """ RETURN : resume -> the counters of a stressor, updated by update_resume
+    """
+    return {"abstracts": 0, "abstracts_with_link": 0, "links": 0, "events": {}}
+
+def update_resume(resume, abstract):
+    """ count one abstract and its links in the resume of the stressor
+    """
+    resume["abstracts"] += 1
+    if 'score' in abstract:
+        resume["abstracts_with_link"] += 1
+        for event in abstract['score']:
+            resume["links"] += 1
+            resume["events"][event] = resume["events"].get(event, 0) + 1
+    return resume
+
+def results_resume(resume, output_file):
+    """ write the resume of a stressor (resume-XX.tsv): the number of PubMed abstracts,
+    the number of events found, the total number of links, then for each found event
+    the number of associated abstracts
+    """
+    output_file.write("abstracts\t{}\n".format(resume["abstracts"]))
+    output_file.write("events\t{}\n".format(len(resume["events"])))
+    output_file.write("links\t{}\n".format(resume["links"]))
+    output_file.write("event\tabstracts\n")
+    for event, count in sorted(resume["events"].items(), key=lambda item: (-item[1], item[0])):
+        output_file.write("{}\t{}\n".format(event, count))
+    return
+
+def write_header(output_file):
+    """ write the header line of the outputs
+    """
+    output_file.write("date \t title \t pmid \t event \n")
+    return
+
+def abstract_to_tsv(abstract, output_file, list_events):
+    """ write the links of one abstract into a tsv (tab-separated values)
+    ARGUMENTS : abstract -> one abstract of the dictonnary with our results
+    output_file -> the file used to store the results
+    list_events -> the events used
+    """
+    if 'score' in abstract:
+        abst_title = abstract['title']
+        abst_id = abstract['pmid']
+        abst_date = abstract["pubdate"]
+        for event, event_values in abstract['score'].items():
+            for ev in events_named(list_events, event):
+                info_abst = "{}\t{}\t{}\t{}\n".format(abst_date, abst_title, abst_id, event)
+                output_file.write(info_abst)
+    return
+
+def abstract_to_tsv_full(abstract, output_file, list_events):
+    """ write the links of one abstract, with the abstract text, into a tsv
+    ARGUMENTS : see abstract_to_tsv
+    """
+    if 'score' in abstract:
+        abst_title = abstract['title']
+        abst_id = abstract['pmid']
+        abst = " ".join(abstract['abstractfull'].split('\n'))
+        abst_date = abstract["pubdate"]
+        for event, event_values in abstract['score'].items():
+            for ev in events_named(list_events, event):
+                info_abst = "{}\t{}\t{}\t{}\t{}\n".format(abst_date, abst_title, abst_id, event, abst)
+                output_file.write(info_abst)
+    return
+
+def abstract_to_txt(abstract, output_file, list_events):
+    """ write one abstract and its events into a txt
+    ARGUMENTS : see abstract_to_tsv
+    """
+    if 'score' in abstract:
+        abst_title = abstract['title']
+        abst_id = abstract['pmid']
+        abst = " ".join(abstract['abstractfull'].split('\n'))
+        abst_date = abstract["pubdate"]
+        list_e=""
+        for event, event_values in abstract['score'].items():
+            for ev in events_named(list_events, event):
+                list_e=list_e + ev['name'] +", "
+        info_abst = "{}\n{}\n{}\n{}\n{}\n\n --------------------------------------- \n\n".format(abst_title, abst_date, abst_id, list_e, abst)
+        output_file.write(info_abst)
+    return
 
 def results_to_tsv(dict_abstracts, output_file, list_events):
     """ write the result into a tsv (tab-separated values)
@@ -36,19 +256,9 @@ def results_to_tsv(dict_abstracts, output_file, list_events):
     output_file -> the file used to store the results
     list_events -> the events used
     """
-    output_file.write("date \t title \t pmid \t event \n")
+    write_header(output_file)
     for abstract in dict_abstracts:
-        if 'score' in abstract:
-            abst_title = abstract['title']
-            abst_id = abstract['pmid']
-            abst = " ".join(abstract['abstractfull'].split('\n'))
-            abst_k = abstract['keywords']
-            abst_date = abstract["pubdate"]
-            for event, event_values in abstract['score'].items():
-                for ev in list_events:
-                    if ev['name'] == event:
-                        info_abst = "{}\t{}\t{}\t{}\n".format(abst_date, abst_title, abst_id, event)
-                        output_file.write(info_abst)
+        abstract_to_tsv(abstract, output_file, list_events)
     return
     
 def results_abstracts_to_tsv(dict_abstracts, output_file, list_events):
@@ -57,19 +267,9 @@ def results_abstracts_to_tsv(dict_abstracts, output_file, list_events):
     output_file -> the file used to store the results
     list_events -> the events used
     """
-    output_file.write("date \t title \t pmid \t event \n")
+    write_header(output_file)
     for abstract in dict_abstracts:
-        if 'score' in abstract:
-            abst_title = abstract['title']
-            abst_id = abstract['pmid']
-            abst = " ".join(abstract['abstractfull'].split('\n'))
-            abst_k = abstract['keywords']
-            abst_date = abstract["pubdate"]
-            for event, event_values in abstract['score'].items():
-                for ev in list_events:
-                    if ev['name'] == event:
-                        info_abst = "{}\t{}\t{}\t{}\t{}\n".format(abst_date, abst_title, abst_id, event, abst)
-                        output_file.write(info_abst)
+        abstract_to_tsv_full(abstract, output_file, list_events)
     return
 
 def results_abstracts_txt(dict_abstracts, output_file, list_events):
@@ -78,19 +278,7 @@ def results_abstracts_txt(dict_abstracts, output_file, list_events):
     output_file -> the file used to store the results
     list_events -> the events used
     """
-    output_file.write("date \t title \t pmid \t event \n")
+    write_header(output_file)
     for abstract in dict_abstracts:
-        if 'score' in abstract:
-            abst_title = abstract['title']
-            abst_id = abstract['pmid']
-            abst = " ".join(abstract['abstractfull'].split('\n'))
-            abst_k = abstract['keywords']
-            abst_date = abstract["pubdate"]
-            list_e=""
-            for event, event_values in abstract['score'].items():
-                for ev in list_events:
-                    if ev['name'] == event:
-                        list_e=list_e + ev['name'] +", "
-            info_abst = "{}\n{}\n{}\n{}\n{}\n\n --------------------------------------- \n\n".format(abst_title, abst_date, abst_id, list_e, abst)
-            output_file.write(info_abst)
+        abstract_to_txt(abstract, output_file, list_events)
     return
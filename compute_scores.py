@@ -23,11 +23,36 @@
 
 #http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
 #-------------------------------------------
-import networkx as nx
+import sys
+import proximity
+import token_index as ti
 import tm_module as tm
 from nltk.tokenize import sent_tokenize
 from nltk import word_tokenize
 
+# work of compute_scores in this process: the candidate (event, sentence) pairs
+# scored, and the ones never scored because the sentence is in the introduction
+scoring_counters = {"pairs_scored": 0, "pairs_pruned": 0}
+
+
+def intro_sentences(abstract, ratio_intro):
+    ''' METHOD: the cleaned sentences in the introduction of the abstract, whose links are removed by
+                check_position, computed from the localisation precomputed by the parser
+    RETURN: a set of sentence indexes, None if the localisation is not precomputed
+    '''
+    if abstract.get('sentence_origin') is None:
+        return None
+    len_abstract = abstract['nb_sentences']
+    return set(i for i, index in enumerate(abstract['sentence_origin']) if index/len_abstract <= ratio_intro)
+
+
+def report_pruning(output=sys.stderr):
+    """Write the number of candidate pairs scored and pruned (introduction)."""
+    total = scoring_counters["pairs_scored"] + scoring_counters["pairs_pruned"]
+    output.write("pairs_scored {}\tpairs_pruned {}\tpruned_rate {:.3f}\n".format(
+        scoring_counters["pairs_scored"], scoring_counters["pairs_pruned"],
+        scoring_counters["pairs_pruned"] / total if total else 0.0))
+
 
 def compute_scores(abstract, events, ratio_intro):
     ''' METHOD: compute the score of presence of the event in the abstract, return also the different position in the abstract.
@@ -40,14 +65,28 @@ def compute_scores(abstract, events, ratio_intro):
     sentences_full = abstract['abstractfull_sentence']
     dico={}
 
-    for event in events:
+    # only the events and sentences with enough common words are scored, all the
+    # overlaps being counted at once
+    pairs = ti.candidate_pairs(ti.abstract_index(abstract), ti.events_index(events))
+    # the sentences of the introduction are not scored
+    intro = intro_sentences(abstract, ratio_intro)
+    for e in sorted(pairs):
+        event = events[e]
         score = []
         words_found = []
         if event["stemname"]!='':
-            score, localisation, sentence, words_found = find_event(sentences, sentences_full, event["stemname"])
+            candidates = pairs[e]
+            if intro:
+                nb_candidates = len(candidates)
+                candidates = {s: positions for s, positions in candidates.items() if s not in intro}
+                scoring_counters["pairs_pruned"] += nb_candidates - len(candidates)
+                if not candidates:
+                    continue
+            scoring_counters["pairs_scored"] += len(candidates)
+            score, localisation, sentence, words_found = find_event(sentences, sentences_full, event["stemname"], candidates)
         if(score):
             # If there is a score, we then check the position in the abstract 
-            localisation, ratio_localisation = real_localisation(abstract, sentence)
+            localisation, ratio_localisation = real_localisation(abstract, sentence, localisation)
             score, localisation, sentence, words_found, ratio_localisation = check_position(score, localisation, sentence, words_found, ratio_localisation, ratio_intro)
             if(score):        
                 dico[str(event["name"])]={}
@@ -58,11 +97,13 @@ def compute_scores(abstract, events, ratio_intro):
                 dico[str(event["name"])]["words_found"]= words_found
     return(dico)
 
-def find_event(sentences, sentences_full, event):
+def find_event(sentences, sentences_full, event, candidates=None):
     #print(sentences, sentences_full, event, '\n\n\n') #Thomas
     ''' METHOD: find a event in a list of sentences and compute the score
     ARGUMENTS: sentences -> a string with the sentences (for example an abstract)
     event -> a string with one event
+    candidates -> the only sentences to score, with the positions of the words of the event
+                  (see token_index.candidate_pairs); all the sentences if None
     RETURN: score, localisation -> the score associated to the event and the abstract, and the localisation of the event (index of the list of sentences) , sentence and number of words found in the sentence
     '''
     event_split = list(set(event.split()))
@@ -73,8 +114,15 @@ def find_event(sentences, sentences_full, event):
     localisation = []
     phrase = []
     ind = 0
-    for i in range(len(sentences)):
-        best, cpt = presence_score(sentences,event_split,i)
+    if candidates is None:
+        indexes = range(len(sentences))
+    else:
+        indexes = sorted(candidates)
+    for i in indexes:
+        if candidates is None:
+            best, cpt = presence_score(sentences,event_split,i)
+        else:
+            best, cpt = score_positions(candidates[i], len(event_split))
         if (abs(1-best/len(event_split)) <= 1 and best!=0):
             score.append(best/len(event_split))
             localisation.append(i)
@@ -92,39 +140,44 @@ def presence_score(sentence, event,i):
 		       i -> the index of the sentence
 	    RETURN: best -> the best score found ; cpt -> number of words found
     '''
-	best = 0
-	cpt = 0
 	index = {}
 	words = sentence[i].split()
 	for e in event:
 		if e in words:
-			cpt += 1
 			index[e] = [pos+1 for pos, value in enumerate(words) if value == e]
-	proportion = cpt/len(event)
-	if 0.75 <= proportion and len(event) != 1:
+	best, cpt = score_positions(index, len(event))
+	return best, cpt
+
+
+def score_positions(index, len_event):
+	''' METHOD: score of presence of an event from the positions of its words in a sentence
+	    ARGUMENTS: index -> a dictionnary word of the event found -> positions in the sentence
+		       len_event -> the number of words of the event
+	    RETURN: best -> the best score found ; cpt -> number of words found
+    '''
+	best = 0
+	cpt = len(index)
+	proportion = cpt/len_event
+	if ti.THRESHOLD <= proportion and len_event != 1:
 		values = index.values()
 		values = [sorted(value) for value in values]
 		values = sorted(values, key = lambda k: k[-1])
-		G = nx.Graph()
-		for i in range(len(values) -1):
-			for j in range(len(values[i])):
-				for l in range(len(values[i + 1])):
-					G.add_edge(values[i][j], values[i+1][l], weight = abs(values[i+1][l]-values[i][j]))
-		shortest_paths = {}
-		for start in values[0]:
-			for end in values[-1]:
-				shortest_path = nx.dijkstra_path(G, start, end)
-				tot_weight = nx.dijkstra_path_length(G, start, end)
-				shortest_paths[tot_weight +1] = shortest_path
-		best = min(shortest_paths, key = shortest_paths.get)
-	elif proportion == 1.0 and len(event) ==1 :
+		best = proximity.best_window(values)
+	elif proportion == 1.0 and len_event ==1 :
 		best = 1.0
 	return best, cpt
 
 
-def real_localisation(abstract, sentences_found):
+def real_localisation(abstract, sentences_found, localisation=None):
     # Find the real localization of the sentence found in the complete abstract (without preprocessing)
     # Returns the position of the sentence in the abstract as an index and a ratio between 0 and 1
+    # The mapping precomputed by the parser is used if available (localisation -> index of the
+    # sentences found in the cleaned abstract)
+    if localisation is not None and abstract.get('sentence_origin') is not None:
+        len_abstract = abstract['nb_sentences']
+        index_localisation = [abstract['sentence_origin'][i] for i in localisation]
+        ratio_localisation = [index/len_abstract for index in index_localisation]
+        return index_localisation, ratio_localisation
     sentences_without_tm = sent_tokenize(abstract["abstractfull"])
     len_abstract = len(sentences_without_tm)
     ratio_localisation = []
@@ -28,16 +28,25 @@
 
 import datetime
 import csv
+import hashlib
+import json
+import os
+import pickle
 import tm_module as tm
+import results_filter as rf
+from event_collection import EventCollection
 import pprint as pprint
 import random
 
+# bump when the preprocessing of the events changes, to invalidate the bundles
+BUNDLE_VERSION = 3
+
 
 def create_collection_event(event_filename):
     """Method to take from a file (event_filename) a list of event from the aopwiki website.
     The file must be a csv with a first col the aopwiki_id, then the type of the event, then the 		name of the event.
     ARGUMENT: event_filename -> the name of the file with the information about the event
-    RETURN: list_events -> a dictionnary with all the events.
+    RETURN: list_events -> a list (EventCollection, indexed by name and id) with all the events.
     """
     list_events = []
     list_id = []
@@ -48,6 +57,7 @@ def create_collection_event(event_filename):
             id_event = rows[0]
             name = rows[0]
             if id_event not in list_id:
+                dict_event["id"] = id_event
                 dict_event["name"] = name
                 dict_event["stemname"] = tm.clean_abstract(name, True, True, "stem", False)
                 dict_event["udate"] = datetime.datetime.now()
@@ -59,4 +69,97 @@ def create_collection_event(event_filename):
                         event["type"].append(t_event)
                         break
                     list_id.append(id_event)
+    return EventCollection(list_events)
+
+
+def prepare_events(list_events, options):
+    """Method to add to the events everything the scoring and the filter need, so that it is
+    computed once per event: the tokens of the stemmed name and, if the results are filtered,
+    the lemmatised name, its tokens and the modulateur verb.
+    ARGUMENT: list_events -> see create_collection_event
+              options -> the options of the run (see pipeline.make_options)
+    RETURN: list_events -> the same list
+    """
+    for event in list_events:
+        event["tokens"] = frozenset(event["stemname"].split())
+        if options["res_filter"] is True:
+            lemma_name, __ = tm.clean_abstract(event["name"], True, True, "lemma", options["context_choice"])
+            event["lemma_name"] = lemma_name
+            event["ev_without_modul"], event["modulateur"] = rf.modulateur_detection(event, options["lemma_supp"])
     return list_events
+
+
+def options_key(options):
+    """Method to identify the options which change the preprocessing of the events (with the spaCy
+    pipeline used by the filter).
+    """
+    used = {key: options[key] for key in ("context_choice", "lemma_supp", "modulateur_supp", "res_filter")}
+    used = [used, tm.SPACY_MODEL, sorted(tm.SPACY_DISABLE), BUNDLE_VERSION]
+    return hashlib.sha1(json.dumps(used, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def bundle_key(event_filename, options):
+    """Method to identify a compiled event list: hash of the csv and of the options (see options_key).
+    """
+    h = hashlib.sha1()
+    with open(event_filename, "rb") as infile:
+        h.update(infile.read())
+    h.update(options_key(options).encode("utf-8"))
+    return h.hexdigest()
+
+
+def bundle_path(event_filename, options):
+    """Method to name the default bundle of a compiled event list: the csv name and the start of
+    the key of the options, so that the bundles of other options (cleaning yes or no) are kept side
+    by side, while the bundle of an older version of the csv is replaced (its key is checked by
+    load_events).
+    """
+    return "{}.{}.bundle".format(event_filename, options_key(options)[:12])
+
+
+def compile_events(event_filename, options, bundle_filename):
+    """Method to preprocess the events of a csv and save them in a bundle file.
+    RETURN: list_events -> the preprocessed events (see prepare_events)
+    """
+    list_events = prepare_events(create_collection_event(event_filename), options)
+    bundle = {"key": bundle_key(event_filename, options), "events": list_events}
+    # a name of its own, several processes may compile the same bundle at once
+    tmp_filename = "{}.tmp-{}".format(bundle_filename, os.getpid())
+    with open(tmp_filename, "wb") as outfile:
+        pickle.dump(bundle, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_filename, bundle_filename)
+    return list_events
+
+
+def read_bundle(bundle_filename):
+    """Method to read the events of a bundle written by compile_events, without checking its key
+    (the bundle was just compiled or checked by load_events, see server.compile_bundles).
+    RETURN: list_events -> the preprocessed events (see prepare_events)
+    """
+    with open(bundle_filename, "rb") as infile:
+        return pickle.load(infile)["events"]
+
+
+def load_events(event_filename, options, bundle_filename=None):
+    """Method to get the preprocessed events of a csv: from the bundle if it is up to date
+    (same csv and options), otherwise the events are compiled again and the bundle rewritten.
+    ARGUMENT: event_filename -> the csv of the events
+              options -> the options of the run (see pipeline.make_options)
+              bundle_filename -> the bundle file, see bundle_path by default
+    RETURN: list_events -> the preprocessed events (see prepare_events)
+    """
+    key = bundle_key(event_filename, options)
+    if bundle_filename is None:
+        bundle_filename = bundle_path(event_filename, options)
+    try:
+        with open(bundle_filename, "rb") as infile:
+            bundle = pickle.load(infile)
+        if bundle.get("key") == key:
+            return bundle["events"]
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+    try:
+        return compile_events(event_filename, options, bundle_filename)
+    except OSError:
+        # the folder of the bundle is not writable: the events are not saved
+        return prepare_events(create_collection_event(event_filename), options)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#authors: Florence Jornod - INSERM UMRS 1124
+#         Thomas Jaylet - Université de Paris - France
+#         Karine Audouze - Université de Paris - France
+
+#contact: systox@paris-descartes.fr
+
+
+#AOP-helpFinder is provided without any warranty. But if you have any probleme please feel free to contact us by mail.
+
+#------- WHAT IS AOPHELPFINDER? -------------
+
+#AOP-helpFinder is a tool developed to help AOP development (Jean-Charles Carvaillo: https://github.com/jecarvaill/aop-helpFinder)(Environ Health Perspect. 2019 Apr;127(4):47005).
+
+#It is based on text mining and parsing process on scientific abstracts. AOP-helpFinder identify links between stressors and molecular initiating event, key events and adverse outcomes through abstracts from the PubMed database (https://pubmed.ncbi.nlm.nih.gov/).
+
+#AOP-helpFinder was implemented under the H2020 Human Biomonintoring in Europe (HBM4EU) project, Work Package 13.1.
+#HBM4EU has received funding from the European Union’s H2020 research and innovation programme under grant agreement No 733032.
+
+#------- LICENCE ---------------------------
+
+#This software is governed by the CeCILL license under French law and abiding by the rules of distribution of free software.  You can  use,  modify and/ or redistribute the software under the terms of the CeCILL license as circulated by CEA, CNRS and INRIA at the following URL
+
+#http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
+#-------------------------------------------
+"""
+The list of the events, indexed by name and by id.
+
+EventCollection is a list of event dictionnaries (so every loop over the
+events is unchanged) which also gives in O(1) the events of a name, as the
+scores of an abstract are keyed by the event name.
+
+The writers of compute_output with a plain list and with an EventCollection
+are compared by benchmark.py --writers.
+"""
+
+
+class EventCollection(list):
+    """List of events with lookup by name (events_named) and by id (event_by_id)."""
+
+    def __init__(self, events=()):
+        super().__init__(events)
+        self.reindex()
+
+    def reindex(self):
+        self.by_name = {}
+        self.by_id = {}
+        # index of the tokens of the events, built when first needed (see token_index.events_index)
+        self.by_token = None
+        for event in self:
+            self._index(event)
+
+    def _index(self, event):
+        # several rows of the csv may have the same name
+        self.by_name.setdefault(event["name"], []).append(event)
+        self.by_id.setdefault(event.get("id", event["name"]), event)
+
+    def append(self, event):
+        super().append(event)
+        self._index(event)
+        self.by_token = None
+
+    def extend(self, events):
+        for event in events:
+            self.append(event)
+
+    def __reduce__(self):
+        # pickle would replay the events through append before restoring the
+        # indexes: the collection is rebuilt from its events instead
+        return (self.__class__, (list(self),))
+
+
+def events_named(list_events, name):
+    ''' METHOD: the events with the given name, in the order of the list
+    ARGUMENTS: list_events -> an EventCollection (or a plain list, scanned)
+               name -> the name of the event (key of the scores of an abstract)
+    RETURN: a list of event dictionnaries (empty if there is none)
+    '''
+    if isinstance(list_events, EventCollection):
+        return list_events.by_name.get(name, [])
+    return [ev for ev in list_events if ev['name'] == name]
+
+
+def event_by_id(list_events, id_event):
+    ''' METHOD: the event with the given id, None if there is none
+    '''
+    if isinstance(list_events, EventCollection):
+        return list_events.by_id.get(id_event)
+    for ev in list_events:
+        if ev.get("id", ev["name"]) == id_event:
+            return ev
+    return None
+
@@ -31,6 +31,7 @@ import sys
 import re
 import time
 import os
+import gzip
 import random
 import requests
 from itertools import chain
@@ -42,6 +43,7 @@ import glob
 import pprint
 import datetime
 import tm_module as tm
+import token_index as ti
 
 
 
@@ -202,7 +204,7 @@ def parse_keywords(medline):
         keywords = ""
     return keywords
 
-def parse_article_info(medline_doi, medline_art, year_info_only, nlm_category, time_start, context_choice):
+def parse_article_info(medline_doi, medline_art, year_info_only, nlm_category, time_start, context_choice, preprocess=True):
     """Parse article nodes from Medline dataset
 
     Parameters
@@ -213,6 +215,10 @@ def parse_article_info(medline_doi, medline_art, year_info_only, nlm_category, t
         see: date_extractor()
     nlm_category: bool
         see: parse_medline_xml()
+    preprocess: bool
+        if False, the text mining of the abstract is left to
+        preprocess_article() (the fields `abstract` and
+        `abstractfull_sentence` are None)
 
     Returns
     -------
@@ -288,8 +294,8 @@ def parse_article_info(medline_doi, medline_art, year_info_only, nlm_category, t
 
     dict_out = {'title': title,
                     'abstractfull': abstract,
-                    'abstract': tm.clean_abstract(abstract, True, False, "stem", context_choice),
-                    'abstractfull_sentence' : tm.clean_abstract(abstract, False, False, "stem", context_choice),
+                    'abstract': None,
+                    'abstractfull_sentence' : None,
                    # 'journal': journal_name,
                    # 'author': authors_info,
                    # 'affiliation': affiliations_info,
@@ -300,9 +306,37 @@ def parse_article_info(medline_doi, medline_art, year_info_only, nlm_category, t
                     'keywords':keywords,
                     'scores':"",
                                         }
+    if preprocess:
+        preprocess_article(dict_out, context_choice)
     return dict_out
 
 
+def preprocess_article(article, context_choice):
+    """Text mining of the abstract of a parsed article: fill the fields
+    `abstract` (cleaned and stemmed sentences) and `abstractfull_sentence`
+    (whole sentences) from `abstractfull`, and the structures read by
+    compute_scores so that it never tokenises again:
+
+    - `token_positions`: token -> {sentence index: positions}
+      (see token_index.index_abstract)
+    - `sentence_origin`: for each cleaned sentence, the index of the
+      sentence in the abstract before preprocessing
+    - `nb_sentences`: the number of sentences before preprocessing
+
+    Returns
+    -------
+    article: dict
+        the same dictionary
+    """
+    # the abstract is tokenised once for both views
+    views = tm.tokenise_abstract(article['abstractfull'], context_choice)
+    article['abstract'] = tm.stem_view(views)
+    article['abstractfull_sentence'] = tm.full_view(views)
+    article['token_positions'] = ti.index_abstract(sentence.split() for sentence in article['abstract'])
+    article['sentence_origin'], article['nb_sentences'] = tm.sentence_origin(views)
+    return article
+
+
 
 def parse_medline_xml(path,time_start, context_choice, year_info_only=True, nlm_category=False):
     """Parse XML file from Medline XML format available at
@@ -348,30 +382,97 @@ def parse_medline_xml(path,time_start, context_choice, year_info_only=True, nlm_
             article_list.append(article_info)
     #article_list = list(map(lambda m: parse_article_info(m[0], year_info_only, nlm_category), medline))
     delete_citations = tree.findall('//DeleteCitation/PMID')
-    dict_delete = \
-        [
-            {'title': None,
-             'abstract': None,
-             'journal': None,
-             'author': None,
-             'affiliation': None,
-             'pubdate': None,
-             'pmid': p.text,
-             'other_id': None,
-             'pmc': None,
-             'mesh_terms': None,
-             'keywords': None,
-             'delete': True,
-             'medline_ta': None,
-             'nlm_unique_id': None,
-             'issn_linking': None,
-             'country': None
-             } for p in delete_citations
-            ]
+    dict_delete = [deleted_article_info(p.text) for p in delete_citations]
     article_list.extend(dict_delete)
     return article_list
 
 
+def deleted_article_info(pmid):
+    """Return the article dictionary of a deleted citation: no information
+    other than the `pmid` and the field `delete` being `True`
+    """
+    return {'title': None,
+            'abstract': None,
+            'journal': None,
+            'author': None,
+            'affiliation': None,
+            'pubdate': None,
+            'pmid': pmid,
+            'other_id': None,
+            'pmc': None,
+            'mesh_terms': None,
+            'keywords': None,
+            'delete': True,
+            'medline_ta': None,
+            'nlm_unique_id': None,
+            'issn_linking': None,
+            'country': None
+            }
+
+
+def open_xml(path):
+    """Open a Medline XML file for reading, gzipped (baseline and update
+    files, `.xml.gz`) or not. `path` can also be a seekable binary file
+    object (an `io.BytesIO` of a downloaded payload for example)
+    """
+    if hasattr(path, 'read'):
+        magic = path.read(2)
+        path.seek(0)
+        if magic == b'\x1f\x8b':
+            return gzip.GzipFile(fileobj=path, mode='rb')
+        return path
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def iter_medline_xml(path, time_start, context_choice, year_info_only=True, nlm_category=False, preprocess=True):
+    """Streaming version of `parse_medline_xml`: the file is read with
+    `lxml.etree.iterparse` and articles are yielded one at a time, in the
+    order of `parse_medline_xml`. Each processed element is cleared so the
+    memory used does not depend on the size of the file.
+
+    Parameters
+    ----------
+    path: str
+        The path of the XML file, gzipped or not, or a binary file object
+        (see `open_xml`)
+    year_info_only: bool
+        see: parse_medline_xml()
+    nlm_category: bool
+        see: parse_medline_xml()
+    preprocess: bool
+        see: parse_article_info()
+
+    Yields
+    ------
+    article: dict
+        Dictionary containing information about the article (see
+        `parse_article_info`). Deleted citations are yielded at the end,
+        with no information other than the field `delete` being `True`
+    """
+    delete_pmids = []
+    with open_xml(path) as xml_file:
+        context = etree.iterparse(xml_file, events=('end',),
+                                  tag=('PubmedArticle', 'DeleteCitation'),
+                                  huge_tree=True)
+        for _, element in context:
+            if element.tag == 'PubmedArticle':
+                yield parse_article_info(element, element.find('MedlineCitation'),
+                                         year_info_only, nlm_category,
+                                         time_start, context_choice, preprocess)
+            else:
+                delete_pmids.extend(p.text for p in element.findall('PMID'))
+            # free the element and the already processed siblings
+            element.clear(keep_tail=True)
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+        del context
+    for pmid in delete_pmids:
+        yield deleted_article_info(pmid)
+
 
 def read_xml(path):
     """
@@ -414,3 +515,8 @@ def get_abstracts_from_pubmedfile(abstracts_file, context_choice):
     dict_xml = parse_medline_xml(abstracts_file, 0, context_choice)
 
     return dict_xml
+
+def iter_abstracts_from_pubmedfile(abstracts_file, context_choice, preprocess=True):
+    """ yield the abstracts of the xml file 'abstracts_file' one at a time
+    """
+    return iter_medline_xml(abstracts_file, 0, context_choice, preprocess=preprocess)
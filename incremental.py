@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+#authors: Florence Jornod - INSERM UMRS 1124
+#         Thomas Jaylet - Université de Paris - France
+#         Karine Audouze - Université de Paris - France
+
+#contact: systox@paris-descartes.fr
+
+
+#AOP-helpFinder is provided without any warranty. But if you have any probleme please feel free to contact us by mail.
+
+#------- WHAT IS AOPHELPFINDER? -------------
+
+#AOP-helpFinder is a tool developed to help AOP development (Jean-Charles Carvaillo: https://github.com/jecarvaill/aop-helpFinder)(Environ Health Perspect. 2019 Apr;127(4):47005).
+
+#It is based on text mining and parsing process on scientific abstracts. AOP-helpFinder identify links between stressors and molecular initiating event, key events and adverse outcomes through abstracts from the PubMed database (https://pubmed.ncbi.nlm.nih.gov/).
+
+#AOP-helpFinder was implemented under the H2020 Human Biomonintoring in Europe (HBM4EU) project, Work Package 13.1.
+#HBM4EU has received funding from the European Union’s H2020 research and innovation programme under grant agreement No 733032.
+
+#------- LICENCE ---------------------------
+
+#This software is governed by the CeCILL license under French law and abiding by the rules of distribution of free software.  You can  use,  modify and/ or redistribute the software under the terms of the CeCILL license as circulated by CEA, CNRS and INRIA at the following URL
+
+#http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
+#-------------------------------------------
+"""
+Incremental run of a stressor with a result store (see result_store).
+
+When only the event list changed since the previous run, the abstracts are
+not preprocessed again and only the new or changed events are scored; the
+scores of the removed events are dropped. The new or revised abstracts are
+preprocessed and scored against every event. The outputs are then written
+from the store, and are the same as the outputs of a full run.
+
+The PubMed update files (--update) are applied to the store: the PMIDs of
+the stressor which are revised are scored again (only if the text of their
+abstract changed), and the deleted citations are removed, so the work depends
+on the size of the update and not of the corpus. The update files are the
+global daily files of PubMed: the other PMIDs they contain are ignored,
+except the new PMIDs of the stressor given with --new_pmids (a file with one
+PMID per line, e.g. the result of the query of the stressor since the last
+run), which are added to the store.
+
+    python incremental.py --abst bisphenol-a.xml --events events.csv \
+        --store bisphenol-a.sqlite --output output-bisphenol-a --outputtype tsv \
+        --cleaning cleaning-yes --intro 20
+    python incremental.py --update pubmed24n1220.xml.gz pubmed24n1221.xml.gz \
+        --new_pmids bisphenol-a-new.txt \
+        --events events.csv --store bisphenol-a.sqlite --output output-bisphenol-a \
+        --outputtype tsv --cleaning cleaning-yes --intro 20
+"""
+import argparse
+import sys
+import time
+import extract_xml_withpmid as exxml
+import compute_output as cout
+import compute_scores as cscores
+import create_collection_event as ev
+import pipeline
+import preprocess_cache
+import result_store as rs
+import tm_module as tm
+from event_collection import EventCollection
+
+# number of abstracts scored together
+BATCH_SIZE = 256
+
+
+def new_counters():
+    return {"abstracts_new": 0, "abstracts_revised": 0, "abstracts_unchanged": 0, "abstracts_removed": 0,
+            "abstracts_deleted": 0, "abstracts_ignored": 0, "events_new": 0, "events_changed": 0, "events_removed": 0,
+            "pairs_scored": 0}
+
+
+def _score(batch, list_events, options, store, counters):
+    ''' METHOD: score a batch of (article, hash) against events and store the scores
+    '''
+    if not batch or not list_events:
+        return
+    names = list(dict.fromkeys(event['name'] for event in list_events))
+    pipeline.process_batch([article for article, __ in batch], list_events, options)
+    for article, hash_abstract in batch:
+        rs.save_scores(store, article, hash_abstract, names)
+    counters["pairs_scored"] += len(batch) * len(names)
+
+
+def _score_stored(store, keys, list_events, options, counters):
+    batch = []
+    for pmid, hash_abstract in sorted(keys):
+        batch.append((rs.load_abstract(store, pmid, hash_abstract), hash_abstract))
+        if len(batch) >= BATCH_SIZE:
+            _score(batch, list_events, options, store, counters)
+            batch = []
+    _score(batch, list_events, options, store, counters)
+
+
+def read_pmids(path):
+    ''' METHOD: the PMIDs of a file, one per line (empty lines and # comments ignored)
+    '''
+    with open(path) as infile:
+        return set(line.strip() for line in infile if line.strip() and not line.startswith('#'))
+
+
+def update_store(store, abstracts, list_events, options, update=False, new_pmids=None):
+    ''' METHOD: bring the store up to date with the abstracts and the events
+    ARGUMENTS: store -> see result_store.open_store
+               abstracts -> an iterable of abstracts, not preprocessed (preprocess=False)
+               list_events, options -> see create_collection_event.load_events and pipeline.make_options
+               update -> False if abstracts is the whole corpus of the stressor: the stored abstracts which
+                         are not in abstracts are removed and the positions are the ones of abstracts.
+                         True if abstracts is a PubMed update file: the other stored abstracts are kept,
+                         the deleted citations are removed, and the PMIDs which are not in the store
+                         are ignored unless they are in new_pmids (they are then added at the end)
+               new_pmids -> with update, the new PMIDs of the stressor (a set), None for none
+    RETURN: counters -> the number of new, revised, unchanged, removed and ignored abstracts and events,
+                        and of scored pairs
+    '''
+    counters = new_counters()
+    context_choice = options["context_choice"]
+    opts_key = rs.options_key(options)
+    if rs.get_meta(store, "options") != opts_key:
+        # other options: every score is computed again
+        rs.clear_scores(store)
+        rs.set_meta(store, "options", opts_key)
+    stored = rs.stored_events(store)
+    current = {}
+    for event in list_events:
+        current[event['name']] = rs.event_key(event)
+    to_score = EventCollection(event for event in list_events if stored.get(event['name']) != current[event['name']])
+    removed = [name for name in stored if name not in current]
+    counters["events_new"] = len(set(name for name in current if name not in stored))
+    counters["events_changed"] = len(set(event['name'] for event in to_score)) - counters["events_new"]
+    counters["events_removed"] = len(removed)
+    rs.delete_event_scores(store, removed)
+
+    # abstracts (pmid, hash) of the store before this file, and of this file
+    before = rs.stored_keys(store)
+    pmids_before = rs.stored_pmids(store)
+    seen = set()
+    deleted = []
+    new_batch = []
+    unchanged_batch = []
+    next_position = rs.next_position(store)
+    if not update:
+        # the positions are the ones of the corpus
+        rs.clear_positions(store)
+    for position, article in enumerate(abstracts):
+        if article.get('delete'):
+            deleted.append(article['pmid'])
+            continue
+        pmid = article['pmid']
+        positions = [position]
+        if update:
+            positions = rs.pmid_positions(store, pmid)
+            if not positions:
+                if new_pmids is None or pmid not in new_pmids:
+                    # an article of the update file which is not one of the stressor
+                    counters["abstracts_ignored"] += 1
+                    continue
+                positions = [next_position]
+                next_position += 1
+        hash_abstract = rs.abstract_hash(article, context_choice)
+        key = (pmid, hash_abstract)
+        for position in positions:
+            rs.set_position(store, position, pmid, hash_abstract)
+        if key in seen:
+            # a PMID found several times: its abstract is scored once
+            continue
+        seen.add(key)
+        if key in before:
+            stored_article = rs.load_abstract(store, pmid, hash_abstract)
+            for field in preprocess_cache.FIELDS + ['token_positions']:
+                article[field] = stored_article[field]
+            unchanged_batch.append((article, hash_abstract))
+            counters["abstracts_unchanged"] += 1
+        else:
+            exxml.preprocess_article(article, context_choice)
+            rs.save_abstract(store, article, hash_abstract)
+            new_batch.append((article, hash_abstract))
+            counters["abstracts_revised" if pmid in pmids_before else "abstracts_new"] += 1
+        if len(new_batch) >= BATCH_SIZE:
+            _score(new_batch, list_events, options, store, counters)
+            new_batch = []
+        if len(unchanged_batch) >= BATCH_SIZE:
+            _score(unchanged_batch, to_score, options, store, counters)
+            unchanged_batch = []
+    _score(new_batch, list_events, options, store, counters)
+    _score(unchanged_batch, to_score, options, store, counters)
+
+    if update:
+        # the deleted citations come after the articles of the file
+        deleted = set(pmid for pmid in deleted if pmid in pmids_before)
+        rs.delete_positions(store, deleted)
+        counters["abstracts_deleted"] = len(deleted)
+    else:
+        counters["abstracts_removed"] = len(pmids_before - rs.stored_pmids(store))
+    # the previous text of the revised abstracts, and the removed or deleted ones
+    rs.delete_unused(store)
+    if update and to_score:
+        # the stored abstracts which are not in the update file
+        _score_stored(store, rs.stored_keys(store) - seen, to_score, options, counters)
+    rs.set_events(store, current)
+    rs.commit_store(store)
+    return counters
+
+
+def write_outputs(store, list_events, output_filename, outputtype, resume_filename=None):
+    ''' METHOD: write the outputs (and the resume) of the stored results
+    RETURN: resume -> see compute_output.new_resume
+    '''
+    stream = cout.open_stream(output_filename, outputtype, list_events, resume_filename)
+    for abstract in rs.iter_results(store, list_events):
+        cout.write_abstract(stream, abstract)
+    return cout.close_stream(stream)
+
+
+def counters_line(counters):
+    return "".join("\t{} {}".format(key, value) for key, value in counters.items())
+
+
+def main(args):
+    start_time = time.time()
+    options = pipeline.make_options(args.intro, args.cleaning, args.spacy_batch_size)
+    list_events = ev.load_events(args.events, options, args.events_bundle)
+    store = rs.open_store(args.store)
+    # the whole corpus (if given), then the update files in their order
+    files = ([(args.abst, False)] if args.abst else []) + [(path, True) for path in args.update]
+    new_pmids = read_pmids(args.new_pmids) if args.new_pmids else None
+    counters = new_counters()
+    for path, update in files:
+        abstracts = exxml.iter_abstracts_from_pubmedfile(path, options["context_choice"], preprocess=False)
+        for key, value in update_store(store, abstracts, list_events, options, update, new_pmids).items():
+            counters[key] += value
+    resume = write_outputs(store, list_events, args.output, args.outputtype, args.resume)
+    rs.close_store(store)
+    name = args.abst or args.store
+    if args.stats:
+        with open(args.stats, "a") as stats_file:
+            stats_file.write(name + "\t" + str(resume["abstracts"]) + counters_line(counters) + "\n")
+    print(name + "   " + str(resume["abstracts"]))
+    sys.stderr.write("total\t{:.3f}s{}\n".format(time.time() - start_time, counters_line(counters)))
+    tm.report_timings()
+    cscores.report_pruning()
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--abst", type=str, help="abstracts file (pubmed xml): the whole corpus of the stressor")
+parser.add_argument("--update", type=str, nargs="*", default=[],
+                    help="PubMed update files (xml) applied in order: revised and deleted citations of the stressor")
+parser.add_argument("--new_pmids", type=str,
+                    help="file of the new PMIDs of the stressor (one per line), added from the update files")
+parser.add_argument("--events", type=str, help="events file")
+parser.add_argument("--store", type=str, help="result store of the stressor (SQLite), created if needed")
+parser.add_argument("--output", type=str, help="output file")
+parser.add_argument("--outputtype", type=str)
+parser.add_argument("--resume", type=str, help="resume file (optional)")
+parser.add_argument("--stats", type=str)
+parser.add_argument("--cleaning", type=str)
+parser.add_argument("--intro", type=int)
+parser.add_argument("--spacy_batch_size", type=int, default=256, help="batch size of the lemmatisation (nlp.pipe)")
+parser.add_argument("--events_bundle", type=str, help="compiled events file (default: events file + .<options key>.bundle)")
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
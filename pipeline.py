@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#authors: Florence Jornod - INSERM UMRS 1124
+#         Thomas Jaylet - Université de Paris - France
+#         Karine Audouze - Université de Paris - France
+
+#contact: systox@paris-descartes.fr
+
+
+#AOP-helpFinder is provided without any warranty. But if you have any probleme please feel free to contact us by mail.
+
+#------- WHAT IS AOPHELPFINDER? -------------
+
+#AOP-helpFinder is a tool developed to help AOP development (Jean-Charles Carvaillo: https://github.com/jecarvaill/aop-helpFinder)(Environ Health Perspect. 2019 Apr;127(4):47005).
+
+#It is based on text mining and parsing process on scientific abstracts. AOP-helpFinder identify links between stressors and molecular initiating event, key events and adverse outcomes through abstracts from the PubMed database (https://pubmed.ncbi.nlm.nih.gov/).
+
+#AOP-helpFinder was implemented under the H2020 Human Biomonintoring in Europe (HBM4EU) project, Work Package 13.1.
+#HBM4EU has received funding from the European Union’s H2020 research and innovation programme under grant agreement No 733032.
+
+#------- LICENCE ---------------------------
+
+#This software is governed by the CeCILL license under French law and abiding by the rules of distribution of free software.  You can  use,  modify and/ or redistribute the software under the terms of the CeCILL license as circulated by CEA, CNRS and INRIA at the following URL
+
+#http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
+#-------------------------------------------
+import collections
+import itertools
+import multiprocessing
+import extract_xml_withpmid as exxml
+import compute_scores as cscores
+import results_filter as rf
+import tm_module as tm
+import preprocess_cache
+import profiling
+
+
+def make_options(intro, cleaning, spacy_batch_size=256, spacy_n_process=1):
+    ''' METHOD: build the options of a run from the command line arguments
+    ARGUMENTS: intro -> the percentage of the abstract considered as introduction (--intro)
+               cleaning -> "cleaning-yes" to lemmatise and filter the results (--cleaning)
+               spacy_batch_size, spacy_n_process -> nlp.pipe parameters of the lemmatisation of the filter
+    RETURN: options -> a dictionnary with the options used by process_batch
+    '''
+    clean = (cleaning == "cleaning-yes")
+    options = {"intro": intro/100.0,
+               "context_choice": clean,
+               "lemma_supp": clean,
+               "modal_supp": clean,
+               "modulateur_supp": clean,
+               "spacy_batch_size": spacy_batch_size,
+               "spacy_n_process": spacy_n_process}
+    options["res_filter"] = (options["lemma_supp"] or options["modal_supp"]
+                             or options["modulateur_supp"])
+    return options
+
+
+def process_batch(abstracts, list_events, options):
+    ''' METHOD: preprocess (if not done yet), score and filter a list of abstracts; the
+                sentences of the whole list are lemmatised together by the filter
+    ARGUMENTS: abstracts -> a list of abstract dictionnaries from extract_xml_withpmid
+               list_events -> the events (see create_collection_event.prepare_events)
+               options -> see make_options
+    RETURN: abstracts -> the same list, with a 'score' key in the abstracts where an event is found
+    '''
+    for abstract in abstracts:
+        if abstract['abstract'] is None:
+            with profiling.stage("clean_abstract"):
+                exxml.preprocess_article(abstract, options["context_choice"])
+        with profiling.stage("compute_scores"):
+            score = cscores.compute_scores(abstract, list_events, options["intro"])
+        if score:
+            abstract['score'] = score
+        profiling.count("abstracts")
+        profiling.count("sentences", len(abstract['abstract']))
+    if options["res_filter"] is True:
+        with profiling.stage("results_filter"):
+            rf.results_filter(abstracts, list_events, options["lemma_supp"], options["modal_supp"],
+                              options["modulateur_supp"], options["context_choice"],
+                              options["spacy_batch_size"], options["spacy_n_process"])
+    # the links of the outputs, after the filter
+    profiling.count("links", sum(len(abstract.get('score', ())) for abstract in abstracts))
+    return abstracts
+
+
+# state of a worker process, set once by _init_worker
+_worker_events = None
+_worker_options = None
+
+
+def _init_worker(list_events, options):
+    global _worker_events, _worker_options
+    _worker_events = list_events
+    # a worker of the pool cannot start the processes of nlp.pipe
+    _worker_options = dict(options, spacy_n_process=1)
+    tm.init_tools(lemma=options["res_filter"])
+    # a forked worker starts with the timers and counters of the main process
+    profiling.take()
+    tm.take_memo_counters()
+
+
+def _process_in_worker(abstracts):
+    before = dict(cscores.scoring_counters)
+    abstracts = process_batch(abstracts, _worker_events, _worker_options)
+    # the counters and timers of the batch are sent back to the main process
+    scoring = {key: value - before[key] for key, value in cscores.scoring_counters.items()}
+    return abstracts, scoring, profiling.take(), tm.take_memo_counters()
+
+
+def _batches(abstracts, size):
+    abstracts = iter(abstracts)
+    while True:
+        batch = list(itertools.islice(abstracts, size))
+        if not batch:
+            return
+        yield batch
+
+
+def open_pool(list_events, options, workers):
+    ''' METHOD: a pool of workers which have the events, the options and the text mining tools loaded,
+                to be given to several calls of process_abstracts (the chunks of checkpoint.py)
+    '''
+    return multiprocessing.Pool(workers, initializer=_init_worker, initargs=(list_events, options))
+
+
+def process_abstracts(abstracts, list_events, options, workers=1, chunksize=32, cache=None, pool=None):
+    ''' METHOD: process every abstract, by batches of chunksize abstracts, in a pool of processes if workers > 1
+    ARGUMENTS: abstracts -> an iterable of abstracts (a generator is read progressively)
+               workers -> the number of processes
+               chunksize -> the number of abstracts processed together (and sent at once to a worker)
+               cache -> a cache of preprocessed abstracts (see preprocess_cache.open_cache), or None
+               pool -> a pool opened by open_pool with the same events and options, kept open after
+                       the call; by default a pool of workers processes is opened for the call
+    RETURN: a generator of the processed abstracts, in the input order
+    '''
+    if cache is not None:
+        # the cache is only read and written by this process
+        yield from _with_cache(abstracts, list_events, options, workers, chunksize, cache, pool)
+        return
+    batches = _batches(abstracts, chunksize)
+    if pool is not None:
+        yield from _process_in_pool(pool, batches, workers)
+        return
+    if workers <= 1:
+        for batch in batches:
+            yield from process_batch(batch, list_events, options)
+        return
+    with open_pool(list_events, options, workers) as pool:
+        yield from _process_in_pool(pool, batches, workers)
+
+
+def _process_in_pool(pool, batches, workers):
+    # the events and options are sent once to each worker, and only a
+    # bounded number of batches is in flight at any time: a new batch is
+    # parsed and sent as soon as a result comes back, so the parsing of
+    # this process overlaps the scoring of the workers
+    window = max(1, workers) * 4
+    pending = collections.deque(pool.apply_async(_process_in_worker, (batch,))
+                                for batch in itertools.islice(batches, window))
+    while pending:
+        batch, scoring, snapshot, memo = pending.popleft().get()
+        for next_batch in itertools.islice(batches, 1):
+            pending.append(pool.apply_async(_process_in_worker, (next_batch,)))
+        for key, value in scoring.items():
+            cscores.scoring_counters[key] += value
+        profiling.merge(snapshot)
+        tm.merge_memo_counters(memo)
+        yield from batch
+
+
+def _with_cache(abstracts, list_events, options, workers, chunksize, cache, pool):
+    hits = collections.deque()
+
+    def looked_up():
+        for abstract in abstracts:
+            hits.append(preprocess_cache.load(cache, abstract, options["context_choice"]))
+            yield abstract
+
+    for abstract in process_abstracts(looked_up(), list_events, options, workers, chunksize, pool=pool):
+        if not hits.popleft():
+            preprocess_cache.save(cache, abstract, options["context_choice"])
+        yield abstract
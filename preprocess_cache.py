@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#authors: Florence Jornod - INSERM UMRS 1124
+#         Thomas Jaylet - Université de Paris - France
+#         Karine Audouze - Université de Paris - France
+
+#contact: systox@paris-descartes.fr
+
+
+#AOP-helpFinder is provided without any warranty. But if you have any probleme please feel free to contact us by mail.
+
+#------- WHAT IS AOPHELPFINDER? -------------
+
+#AOP-helpFinder is a tool developed to help AOP development (Jean-Charles Carvaillo: https://github.com/jecarvaill/aop-helpFinder)(Environ Health Perspect. 2019 Apr;127(4):47005).
+
+#It is based on text mining and parsing process on scientific abstracts. AOP-helpFinder identify links between stressors and molecular initiating event, key events and adverse outcomes through abstracts from the PubMed database (https://pubmed.ncbi.nlm.nih.gov/).
+
+#AOP-helpFinder was implemented under the H2020 Human Biomonintoring in Europe (HBM4EU) project, Work Package 13.1.
+#HBM4EU has received funding from the European Union’s H2020 research and innovation programme under grant agreement No 733032.
+
+#------- LICENCE ---------------------------
+
+#This software is governed by the CeCILL license under French law and abiding by the rules of distribution of free software.  You can  use,  modify and/ or redistribute the software under the terms of the CeCILL license as circulated by CEA, CNRS and INRIA at the following URL
+
+#http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
+#-------------------------------------------
+"""
+On-disk cache (SQLite) of the preprocessed abstracts.
+
+An entry is keyed by the PMID and a hash of the abstract text and of the
+cleaning options, so a revised abstract or another `context_choice` is a
+miss. It stores the outputs of extract_xml_withpmid.preprocess_article, so
+an unchanged abstract skips the text mining entirely. The least recently
+used entries are evicted when the cache is larger than its size limit,
+checked every COMMIT_EVERY writes and when the cache is closed.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+import token_index as ti
+
+# bump when the preprocessing changes, to invalidate the old entries
+CACHE_VERSION = 1
+# fields of the article stored in the cache (token_positions is rebuilt)
+FIELDS = ['abstract', 'abstractfull_sentence', 'sentence_origin', 'nb_sentences']
+# number of writes between two commits (and two applications of the size limit)
+COMMIT_EVERY = 500
+
+
+def open_cache(path, max_size_mb=1024, shared=False):
+    ''' METHOD: open (and create if needed) the cache
+    ARGUMENTS: path -> the SQLite file
+               max_size_mb -> the maximal size of the stored entries, in MB
+               shared -> the file is used by several processes at the same time (the workers of
+                         batch.py): WAL journal and one short transaction per write
+    RETURN: cache -> a dictionnary with the connection and the hit/miss counters
+    '''
+    conn = sqlite3.connect(path, timeout=60)
+    if shared:
+        # the readers do not block the writer, nor the writer the readers
+        conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS abstracts ("
+                 "key TEXT PRIMARY KEY, pmid TEXT, data BLOB, size INTEGER, last_used REAL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS abstracts_last_used ON abstracts (last_used)")
+    conn.commit()
+    return {'conn': conn,
+            'max_size': int(max_size_mb * 1024 * 1024),
+            'commit_every': 1 if shared else COMMIT_EVERY,
+            'pending': 0,
+            'writes': 0,
+            # (time, key) of the hits, written in one transaction (see commit)
+            'touched': [],
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0}
+
+
+def cache_key(article, context_choice, process="stem"):
+    ''' METHOD: the key of an article: PMID + hash of the abstract text and of the cleaning options
+    '''
+    h = hashlib.sha1()
+    h.update(article['abstractfull'].encode('utf-8'))
+    h.update("|{}|{}|{}".format(context_choice, process, CACHE_VERSION).encode('utf-8'))
+    return "{}:{}".format(article['pmid'], h.hexdigest())
+
+
+def commit(cache):
+    ''' METHOD: write the last use of the hits and commit the pending writes
+    '''
+    conn = cache['conn']
+    if cache['touched']:
+        conn.executemany("UPDATE abstracts SET last_used = ? WHERE key = ?", cache['touched'])
+        cache['touched'] = []
+    conn.commit()
+    cache['pending'] = 0
+
+
+def _written(cache):
+    cache['pending'] += 1
+    cache['writes'] += 1
+    if cache['writes'] % COMMIT_EVERY == 0:
+        # the size limit is kept during the run, not only at its end
+        commit(cache)
+        evict(cache)
+    elif cache['pending'] >= cache['commit_every']:
+        commit(cache)
+
+
+def load(cache, article, context_choice):
+    ''' METHOD: fill the preprocessed fields of an article from the cache
+    RETURN: True if the article was found (hit), False otherwise (miss)
+    '''
+    key = cache_key(article, context_choice)
+    row = cache['conn'].execute("SELECT data FROM abstracts WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        cache['misses'] += 1
+        return False
+    article.update(json.loads(zlib.decompress(row[0]).decode('utf-8')))
+    article['token_positions'] = ti.index_abstract(sentence.split() for sentence in article['abstract'])
+    # a hit does not write: its last use is recorded with the next commit
+    cache['touched'].append((time.time(), key))
+    if len(cache['touched']) >= COMMIT_EVERY:
+        commit(cache)
+    cache['hits'] += 1
+    return True
+
+
+def save(cache, article, context_choice):
+    ''' METHOD: store the preprocessed fields of an article in the cache
+    '''
+    data = zlib.compress(json.dumps({field: article[field] for field in FIELDS}).encode('utf-8'))
+    cache['conn'].execute("INSERT OR REPLACE INTO abstracts VALUES (?, ?, ?, ?, ?)",
+                          (cache_key(article, context_choice), article['pmid'], data, len(data), time.time()))
+    _written(cache)
+
+
+def evict(cache):
+    ''' METHOD: remove the least recently used entries while the cache is larger than its limit
+                (down to 90% of the limit)
+    RETURN: the number of entries removed
+    '''
+    conn = cache['conn']
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM abstracts").fetchone()[0]
+    if total <= cache['max_size']:
+        return 0
+    target = total - int(cache['max_size'] * 0.9)
+    freed = 0
+    keys = []
+    for key, size in conn.execute("SELECT key, size FROM abstracts ORDER BY last_used"):
+        if freed >= target:
+            break
+        keys.append((key,))
+        freed += size
+    conn.executemany("DELETE FROM abstracts WHERE key = ?", keys)
+    conn.commit()
+    removed = len(keys)
+    cache['evictions'] += removed
+    return removed
+
+
+def close_cache(cache):
+    ''' METHOD: commit, apply the size limit and close the cache
+    '''
+    commit(cache)
+    evict(cache)
+    cache['conn'].close()
+
+
+def stats_line(cache):
+    ''' METHOD: the hit/miss statistics of the cache, as tab-separated fields for the stats file
+    '''
+    lookups = cache['hits'] + cache['misses']
+    rate = cache['hits'] / lookups if lookups else 0.0
+    return "\tcache_hits {}\tcache_misses {}\tcache_hit_rate {:.3f}\tcache_evictions {}".format(
+        cache['hits'], cache['misses'], rate, cache['evictions'])
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#authors: Florence Jornod - INSERM UMRS 1124
+#         Thomas Jaylet - Université de Paris - France
+#         Karine Audouze - Université de Paris - France
+
+#contact: systox@paris-descartes.fr
+
+
+#AOP-helpFinder is provided without any warranty. But if you have any probleme please feel free to contact us by mail.
+
+#------- WHAT IS AOPHELPFINDER? -------------
+
+#AOP-helpFinder is a tool developed to help AOP development (Jean-Charles Carvaillo: https://github.com/jecarvaill/aop-helpFinder)(Environ Health Perspect. 2019 Apr;127(4):47005).
+
+#It is based on text mining and parsing process on scientific abstracts. AOP-helpFinder identify links between stressors and molecular initiating event, key events and adverse outcomes through abstracts from the PubMed database (https://pubmed.ncbi.nlm.nih.gov/).
+
+#AOP-helpFinder was implemented under the H2020 Human Biomonintoring in Europe (HBM4EU) project, Work Package 13.1.
+#HBM4EU has received funding from the European Union’s H2020 research and innovation programme under grant agreement No 733032.
+
+#------- LICENCE ---------------------------
+
+#This software is governed by the CeCILL license under French law and abiding by the rules of distribution of free software.  You can  use,  modify and/ or redistribute the software under the terms of the CeCILL license as circulated by CEA, CNRS and INRIA at the following URL
+
+#http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
+#-------------------------------------------
+"""
+Instrumentation of a run: wall/CPU timers per stage and counters.
+
+As the load timings of tm_module, the timers and counters are module-level
+dictionnaries of this process. The workers of a pool send theirs back with
+take(), and the main process adds them with merge(). The wall times of a
+stage are therefore summed over the processes.
+
+    with profiling.stage("compute_scores"):
+        ...
+    profiling.count("abstracts")
+
+The record of a stressor (see run_record) is appended as one JSON line to
+the sidecar of the stats file (stats.txt -> stats.jsonl). With --profile,
+the run is also profiled with cProfile and the statistics dumped in a pstats
+file (python -m pstats file.pstats).
+"""
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+
+# stage -> {"wall": seconds, "cpu": seconds, "calls": number}
+stage_timings = {}
+# counter name -> value
+counters = {}
+
+
+@contextlib.contextmanager
+def stage(name, thread=False):
+    ''' METHOD: time the wall and CPU time of a block as the stage name
+    ARGUMENTS: thread -> the CPU time of the current thread only (a block run in a thread beside
+                         the main one, e.g. the writer thread of compute_output)
+    '''
+    clock = time.thread_time if thread else time.process_time
+    wall = time.perf_counter()
+    cpu = clock()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - wall, clock() - cpu)
+
+
+def add_time(name, wall, cpu, calls=1):
+    timing = stage_timings.get(name)
+    if timing is None:
+        timing = stage_timings[name] = {"wall": 0.0, "cpu": 0.0, "calls": 0}
+    timing["wall"] += wall
+    timing["cpu"] += cpu
+    timing["calls"] += calls
+
+
+def count(name, value=1):
+    counters[name] = counters.get(name, 0) + value
+
+
+def timed_iter(name, iterable):
+    ''' METHOD: time the production of every item of an iterable (a generator of abstracts read from
+                a file for example) as the stage name
+    '''
+    iterator = iter(iterable)
+    while True:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            add_time(name, time.perf_counter() - wall, time.process_time() - cpu)
+        yield item
+
+
+def take():
+    ''' METHOD: the timers and counters of this process, which are then reset
+    RETURN: snapshot -> a dictionnary with "stages" and "counters" (see merge)
+    '''
+    global stage_timings, counters
+    snapshot = {"stages": stage_timings, "counters": counters}
+    stage_timings = {}
+    counters = {}
+    return snapshot
+
+
+def merge(snapshot):
+    ''' METHOD: add the timers and counters of another process (see take)
+    '''
+    for name, timing in snapshot["stages"].items():
+        add_time(name, timing["wall"], timing["cpu"], timing["calls"])
+    for name, value in snapshot["counters"].items():
+        count(name, value)
+
+
+def peak_rss_mb(children=False):
+    ''' METHOD: the peak resident memory of the process, in MB (None if unknown)
+    ARGUMENTS: children -> the peak of its largest child process instead (the workers of a pool,
+                           once they have ended), 0 if it had none
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_record(snapshot, **fields):
+    ''' METHOD: the record of a run (or of a stressor) for the sidecar
+    ARGUMENTS: snapshot -> the timers and counters of the run (see take)
+               fields -> the other fields of the record (name of the stressor, number of abstracts...)
+    '''
+    record = dict(fields)
+    # this process, and the largest of its workers
+    record["peak_rss_mb"] = peak_rss_mb()
+    record["peak_rss_children_mb"] = peak_rss_mb(children=True)
+    record["stages"] = snapshot["stages"]
+    record["counters"] = snapshot["counters"]
+    return record
+
+
+def sidecar_path(stats_path):
+    ''' METHOD: the JSON lines file next to a stats file (stats.txt -> stats.jsonl)
+    '''
+    return os.path.splitext(stats_path)[0] + ".jsonl"
+
+
+def write_record(path, record):
+    with open(path, "a") as outfile:
+        outfile.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def start_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_profile(profiler, path):
+    ''' METHOD: stop a profiler started by start_profile and dump its statistics (pstats file)
+    '''
+    if profiler is None:
+        return
+    profiler.disable()
+    profiler.dump_stats(path)
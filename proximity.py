@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#authors: Florence Jornod - INSERM UMRS 1124
+#         Thomas Jaylet - Université de Paris - France
+#         Karine Audouze - Université de Paris - France
+
+#contact: systox@paris-descartes.fr
+
+
+#AOP-helpFinder is provided without any warranty. But if you have any probleme please feel free to contact us by mail.
+
+#------- WHAT IS AOPHELPFINDER? -------------
+
+#AOP-helpFinder is a tool developed to help AOP development (Jean-Charles Carvaillo: https://github.com/jecarvaill/aop-helpFinder)(Environ Health Perspect. 2019 Apr;127(4):47005).
+
+#It is based on text mining and parsing process on scientific abstracts. AOP-helpFinder identify links between stressors and molecular initiating event, key events and adverse outcomes through abstracts from the PubMed database (https://pubmed.ncbi.nlm.nih.gov/).
+
+#AOP-helpFinder was implemented under the H2020 Human Biomonintoring in Europe (HBM4EU) project, Work Package 13.1.
+#HBM4EU has received funding from the European Union’s H2020 research and innovation programme under grant agreement No 733032.
+
+#------- LICENCE ---------------------------
+
+#This software is governed by the CeCILL license under French law and abiding by the rules of distribution of free software.  You can  use,  modify and/ or redistribute the software under the terms of the CeCILL license as circulated by CEA, CNRS and INRIA at the following URL
+
+#http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
+#-------------------------------------------
+"""
+Proximity scoring: the "best" window value of presence_score.
+
+The words of an event found in a sentence give one sorted list of positions
+per word (a layer), the layers being ordered by their last position. The
+historical implementation linked every position of a layer to every position
+of the next one in a networkx graph (weight = distance between the two
+positions) and ran Dijkstra for every (first layer, last layer) pair of
+positions. best_window computes the same value without building the graph:
+
+    - the distances from a start to every position of the last layer are
+      computed layer by layer with two sweeps over the sorted positions
+      (a layered path is always a shortest path, the weights being
+      distances between integers), i.e. in linear time per start;
+    - the value returned by the graph version is the weight of the path that
+      is the smallest as a list, among the last path stored for each weight.
+      Paths only need to be compared when the smallest start is stored for
+      several weights; only then are the paths rebuilt, with the same
+      tie-breaking as networkx.
+
+The equivalence with the graph version (kept in test_proximity.py) is
+checked on random layers and on the windows of real abstract sentences
+(test_proximity_windows.json).
+"""
+import heapq
+import itertools
+import profiling
+
+INF = float('inf')
+
+
+def _relax(prev_pos, prev_dist, pos):
+    ''' METHOD: distances to the positions of a layer from the distances to the previous layer
+    ARGUMENTS: prev_pos -> sorted positions of the previous layer
+               prev_dist -> distance of each position of the previous layer
+               pos -> sorted positions of the layer
+    RETURN: dist -> min(prev_dist[a] + |a - b|) for each position b of pos
+    '''
+    dist = []
+    best = INF
+    i = 0
+    # positions of the previous layer on the left: prev_dist[a] - a + b
+    for b in pos:
+        while i < len(prev_pos) and prev_pos[i] <= b:
+            best = min(best, prev_dist[i] - prev_pos[i])
+            i += 1
+        dist.append(best + b)
+    best = INF
+    i = len(prev_pos) - 1
+    # positions of the previous layer on the right: prev_dist[a] + a - b
+    for k in range(len(pos) - 1, -1, -1):
+        b = pos[k]
+        while i >= 0 and prev_pos[i] >= b:
+            best = min(best, prev_dist[i] + prev_pos[i])
+            i -= 1
+        dist[k] = min(dist[k], best - b)
+    return dist
+
+
+def _distances_to_last_layer(values, start):
+    dist = [0]
+    prev_pos = [start]
+    for pos in values[1:]:
+        dist = _relax(prev_pos, dist, pos)
+        prev_pos = pos
+    return dist
+
+
+def _shortest_paths(values, source):
+    ''' METHOD: shortest paths from source in the graph of the layers, with the tie-breaking of
+                networkx (Dijkstra, neighbours in the order of insertion of the edges)
+    RETURN: paths -> a dictionnary position -> path (list of positions)
+    '''
+    layer = {}
+    for j, pos in enumerate(values):
+        for p in pos:
+            layer[p] = j
+    counter = itertools.count()
+    dist = {}
+    seen = {source: 0}
+    paths = {source: [source]}
+    fringe = [(0, next(counter), source)]
+    while fringe:
+        d, _, v = heapq.heappop(fringe)
+        if v in dist:
+            continue
+        dist[v] = d
+        j = layer[v]
+        neighbours = []
+        if j > 0:
+            neighbours = values[j - 1]
+        if j < len(values) - 1:
+            neighbours = neighbours + values[j + 1]
+        for u in neighbours:
+            if u in dist:
+                continue
+            vu_dist = d + abs(u - v)
+            if u not in seen or vu_dist < seen[u]:
+                seen[u] = vu_dist
+                heapq.heappush(fringe, (vu_dist, next(counter), u))
+                paths[u] = paths[v] + [u]
+    return paths
+
+
+def best_window(values):
+    ''' METHOD: the "best" value of presence_score
+    ARGUMENTS: values -> a list (at least 2) of sorted lists of positions (one per word found),
+                         ordered by their last position
+    RETURN: best -> the weight of the selected path + 1
+    '''
+    profiling.count("proximity_windows")
+    if all(len(pos) == 1 for pos in values):
+        # one position per word: a single path
+        return sum(abs(values[i + 1][0] - values[i][0]) for i in range(len(values) - 1)) + 1
+    stored = {}
+    for start in values[0]:
+        for end, weight in zip(values[-1], _distances_to_last_layer(values, start)):
+            stored[weight] = (start, end)
+    first = min(start for start, end in stored.values())
+    candidates = [weight for weight, (start, end) in stored.items() if start == first]
+    if len(candidates) == 1:
+        return candidates[0] + 1
+    profiling.count("proximity_path_rebuilds")
+    paths = _shortest_paths(values, first)
+    return min(candidates, key=lambda weight: paths[stored[weight][1]]) + 1
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+#authors: Florence Jornod - INSERM UMRS 1124
+#         Thomas Jaylet - Université de Paris - France
+#         Karine Audouze - Université de Paris - France
+
+#contact: systox@paris-descartes.fr
+
+
+#AOP-helpFinder is provided without any warranty. But if you have any probleme please feel free to contact us by mail.
+
+#------- WHAT IS AOPHELPFINDER? -------------
+
+#AOP-helpFinder is a tool developed to help AOP development (Jean-Charles Carvaillo: https://github.com/jecarvaill/aop-helpFinder)(Environ Health Perspect. 2019 Apr;127(4):47005).
+
+#It is based on text mining and parsing process on scientific abstracts. AOP-helpFinder identify links between stressors and molecular initiating event, key events and adverse outcomes through abstracts from the PubMed database (https://pubmed.ncbi.nlm.nih.gov/).
+
+#AOP-helpFinder was implemented under the H2020 Human Biomonintoring in Europe (HBM4EU) project, Work Package 13.1.
+#HBM4EU has received funding from the European Union’s H2020 research and innovation programme under grant agreement No 733032.
+
+#------- LICENCE ---------------------------
+
+#This software is governed by the CeCILL license under French law and abiding by the rules of distribution of free software.  You can  use,  modify and/ or redistribute the software under the terms of the CeCILL license as circulated by CEA, CNRS and INRIA at the following URL
+
+#http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
+#-------------------------------------------
+"""
+Persistent result store (SQLite) of a stressor.
+
+It keeps, from one run to the next:
+    - the abstracts, keyed by PMID and hash of the abstract text:
+      information for the outputs and preprocessed text;
+    - the positions of the abstracts in the outputs: a PMID found several
+      times in the corpus has several positions, as in the outputs of a
+      full run;
+    - the scores of every (abstract, event) pair with a link (the values of
+      abstract['score'][event] after the filter);
+    - the events the abstracts were scored against, with a hash of their
+      preprocessing, and the options of the run.
+
+Every stored abstract has been scored against every stored event, so only
+the new or changed abstracts and events have to be scored again.
+"""
+import hashlib
+import json
+import sqlite3
+import zlib
+import token_index as ti
+
+# bump when the tables change: an older store is emptied
+STORE_VERSION = 2
+# fields of an article which are not stored (rebuilt or scores)
+NOT_STORED = ('score', 'token_positions')
+TABLES = ("abstracts", "positions", "events", "scores")
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value).encode('utf-8'))
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+
+def open_store(path):
+    ''' METHOD: open (and create if needed) the result store
+    RETURN: store -> the SQLite connection; nothing is committed before commit_store
+    '''
+    store = sqlite3.connect(path, timeout=60)
+    store.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    if get_meta(store, "version") != str(STORE_VERSION):
+        for table in TABLES:
+            store.execute("DROP TABLE IF EXISTS {}".format(table))
+        store.execute("DELETE FROM meta")
+        set_meta(store, "version", str(STORE_VERSION))
+    store.execute("CREATE TABLE IF NOT EXISTS abstracts ("
+                  "pmid TEXT, hash TEXT, data BLOB, PRIMARY KEY (pmid, hash))")
+    store.execute("CREATE TABLE IF NOT EXISTS positions (position INTEGER PRIMARY KEY, pmid TEXT, hash TEXT)")
+    store.execute("CREATE INDEX IF NOT EXISTS positions_pmid ON positions (pmid, hash)")
+    store.execute("CREATE TABLE IF NOT EXISTS events (name TEXT PRIMARY KEY, key TEXT)")
+    store.execute("CREATE TABLE IF NOT EXISTS scores ("
+                  "pmid TEXT, hash TEXT, event TEXT, data BLOB, PRIMARY KEY (pmid, hash, event))")
+    store.execute("CREATE INDEX IF NOT EXISTS scores_event ON scores (event)")
+    store.commit()
+    return store
+
+
+def commit_store(store):
+    store.commit()
+
+
+def close_store(store):
+    store.commit()
+    store.close()
+
+
+def get_meta(store, key):
+    row = store.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return None if row is None else row[0]
+
+
+def set_meta(store, key, value):
+    store.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+
+def options_key(options):
+    ''' METHOD: the options which change the scores (not the spaCy batch parameters)
+    '''
+    return json.dumps({key: value for key, value in options.items()
+                       if not key.startswith("spacy_")}, sort_keys=True)
+
+
+def event_key(event):
+    ''' METHOD: hash of what is used to score and filter an event
+    '''
+    used = [event.get(key) for key in ("name", "stemname", "lemma_name", "ev_without_modul", "modulateur")]
+    return hashlib.sha1(json.dumps(used).encode('utf-8')).hexdigest()
+
+
+def abstract_hash(article, context_choice):
+    ''' METHOD: hash of what is used to preprocess an abstract
+    '''
+    h = hashlib.sha1(article['abstractfull'].encode('utf-8'))
+    h.update("|{}".format(context_choice).encode('utf-8'))
+    return h.hexdigest()
+
+
+def stored_events(store):
+    ''' METHOD: the events of the store
+    RETURN: a dictionnary name -> key (see event_key)
+    '''
+    return dict(store.execute("SELECT name, key FROM events"))
+
+
+def set_events(store, events_keys):
+    ''' METHOD: replace the events of the store by events_keys (name -> key)
+    '''
+    store.execute("DELETE FROM events")
+    store.executemany("INSERT INTO events VALUES (?, ?)", list(events_keys.items()))
+
+
+def load_abstract(store, pmid, hash_abstract):
+    ''' METHOD: the stored abstract of a PMID and a text
+    RETURN: article -> or None if it is not in the store
+    '''
+    row = store.execute("SELECT data FROM abstracts WHERE pmid = ? AND hash = ?", (pmid, hash_abstract)).fetchone()
+    if row is None:
+        return None
+    article = _unpack(row[0])
+    article['token_positions'] = ti.index_abstract(sentence.split() for sentence in article['abstract'])
+    return article
+
+
+def save_abstract(store, article, hash_abstract):
+    ''' METHOD: store (or replace) a preprocessed abstract, without its scores
+    '''
+    data = {key: value for key, value in article.items() if key not in NOT_STORED}
+    store.execute("INSERT OR REPLACE INTO abstracts VALUES (?, ?, ?)", (article['pmid'], hash_abstract, _pack(data)))
+
+
+def stored_keys(store):
+    ''' METHOD: the (pmid, hash) of the stored abstracts
+    '''
+    return set(store.execute("SELECT pmid, hash FROM abstracts"))
+
+
+def set_position(store, position, pmid, hash_abstract):
+    ''' METHOD: put an abstract at a position of the outputs
+    '''
+    store.execute("INSERT OR REPLACE INTO positions VALUES (?, ?, ?)", (position, pmid, hash_abstract))
+
+
+def pmid_positions(store, pmid):
+    ''' METHOD: the positions of a PMID in the outputs (empty if the PMID is not in the store)
+    '''
+    return [row[0] for row in store.execute("SELECT position FROM positions WHERE pmid = ? ORDER BY position",
+                                            (pmid,))]
+
+
+def next_position(store):
+    ''' METHOD: the position after the last stored abstract
+    '''
+    return store.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM positions").fetchone()[0]
+
+
+def stored_pmids(store):
+    return set(row[0] for row in store.execute("SELECT DISTINCT pmid FROM positions"))
+
+
+def clear_positions(store):
+    store.execute("DELETE FROM positions")
+
+
+def delete_positions(store, pmids):
+    ''' METHOD: remove PMIDs from the outputs (their abstracts are removed by delete_unused)
+    '''
+    store.executemany("DELETE FROM positions WHERE pmid = ?", [(pmid,) for pmid in pmids])
+
+
+def delete_unused(store):
+    ''' METHOD: remove the abstracts (and their scores) which have no position in the outputs anymore
+                (removed or deleted PMIDs, previous text of a revised abstract)
+    '''
+    unused = "(pmid, hash) NOT IN (SELECT pmid, hash FROM positions)"
+    store.execute("DELETE FROM scores WHERE " + unused)
+    store.execute("DELETE FROM abstracts WHERE " + unused)
+
+
+def delete_event_scores(store, names):
+    ''' METHOD: remove the scores of events, for every abstract
+    '''
+    store.executemany("DELETE FROM scores WHERE event = ?", [(name,) for name in names])
+
+
+def clear_scores(store):
+    store.execute("DELETE FROM scores")
+    store.execute("DELETE FROM events")
+
+
+def save_scores(store, article, hash_abstract, names):
+    ''' METHOD: store the scores of an abstract for the events scored (names): the previous scores of
+                these events are replaced, the events without link are not stored
+    '''
+    pmid = article['pmid']
+    store.executemany("DELETE FROM scores WHERE pmid = ? AND hash = ? AND event = ?",
+                      [(pmid, hash_abstract, name) for name in names])
+    score = article.get('score', {})
+    store.executemany("INSERT INTO scores VALUES (?, ?, ?, ?)",
+                      [(pmid, hash_abstract, name, _pack(score[name])) for name in names if name in score])
+
+
+def iter_results(store, list_events):
+    ''' METHOD: the stored abstracts with their scores, as after a full run
+    ARGUMENTS: list_events -> the events, whose order is the order of the scores of an abstract
+    RETURN: a generator of abstract dictionnaries, in the order of the positions
+    '''
+    order = {}
+    for ev in list_events:
+        order.setdefault(ev['name'], len(order))
+    cursor = store.cursor()
+    for pmid, hash_abstract, data in cursor.execute(
+            "SELECT positions.pmid, positions.hash, data FROM positions JOIN abstracts "
+            "ON abstracts.pmid = positions.pmid AND abstracts.hash = positions.hash ORDER BY position"):
+        article = _unpack(data)
+        rows = store.execute("SELECT event, data FROM scores WHERE pmid = ? AND hash = ?",
+                             (pmid, hash_abstract)).fetchall()
+        rows = sorted((row for row in rows if row[0] in order), key=lambda row: order[row[0]])
+        if rows:
+            article['score'] = {event: _unpack(values) for event, values in rows}
+        yield article
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+#authors: Florence Jornod - INSERM UMRS 1124
+#         Thomas Jaylet - Université de Paris - France
+#         Karine Audouze - Université de Paris - France
+
+#contact: systox@paris-descartes.fr
+
+
+#AOP-helpFinder is provided without any warranty. But if you have any probleme please feel free to contact us by mail.
+
+#------- WHAT IS AOPHELPFINDER? -------------
+
+#AOP-helpFinder is a tool developed to help AOP development (Jean-Charles Carvaillo: https://github.com/jecarvaill/aop-helpFinder)(Environ Health Perspect. 2019 Apr;127(4):47005).
+
+#It is based on text mining and parsing process on scientific abstracts. AOP-helpFinder identify links between stressors and molecular initiating event, key events and adverse outcomes through abstracts from the PubMed database (https://pubmed.ncbi.nlm.nih.gov/).
+
+#AOP-helpFinder was implemented under the H2020 Human Biomonintoring in Europe (HBM4EU) project, Work Package 13.1.
+#HBM4EU has received funding from the European Union’s H2020 research and innovation programme under grant agreement No 733032.
+
+#------- LICENCE ---------------------------
+
+#This software is governed by the CeCILL license under French law and abiding by the rules of distribution of free software.  You can  use,  modify and/ or redistribute the software under the terms of the CeCILL license as circulated by CEA, CNRS and INRIA at the following URL
+
+#http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
+#-------------------------------------------
+"""
+Compact columnar table of the results.
+
+The score dictionnaries of the abstracts (parallel lists with a copy of
+every sentence) are still built by the scoring and read by the writers of
+compute_output, one abstract at a time; the table is the compact form of
+the links kept for the whole run (aophelpfinder.py --table), once an
+abstract has been written. Only the abstracts with at least one link are
+stored, with one row per link, keyed by (abstract idx, event idx, sentence
+idx), in typed arrays:
+
+    abstract     index of the abstract (see table["abstracts"], the abstracts
+                 with a link only)
+    event        index of the event name (see table["events"])
+    sentence     index of the sentence in the abstract (localisation)
+    text         index of the text of the sentence (see table["texts"]); a
+                 text is stored once, whatever the number of links
+    score        multiscore
+    words_found, words_to_find
+    modal, modulateur
+                 1 (True), 0 (False), -1 (None: event without modulateur)
+                 or -2 (not filtered)
+
+The rows of an abstract are contiguous, from table["offsets"][idx] to
+table["offsets"][idx + 1].
+
+export_table writes one raw little-endian file per column (<column>.bin,
+readable with numpy.fromfile) and a schema.json, plus JSON lines files for
+the abstracts, events and texts. to_numpy and export_npz need numpy,
+export_parquet needs pyarrow; they are imported only when used.
+
+    python result_table.py table_dir
+        -> number of links of each event of an exported table
+"""
+import array
+import json
+import os
+import sys
+
+TABLE_VERSION = 2
+COLUMNS = [("abstract", "I"),
+           ("event", "I"),
+           ("sentence", "I"),
+           ("text", "I"),
+           ("score", "d"),
+           ("words_found", "I"),
+           ("words_to_find", "I"),
+           ("modal", "b"),
+           ("modulateur", "b")]
+NUMPY_TYPES = {"I": "<u4", "d": "<f8", "b": "i1", "Q": "<u8"}
+
+
+def new_table(list_events=()):
+    ''' METHOD: an empty table
+    ARGUMENTS: list_events -> the events, to give their index in the order of the events file
+    RETURN: table -> a dictionnary of the columns and of the abstracts, events and texts referenced
+    '''
+    table = {"columns": {name: array.array(code) for name, code in COLUMNS},
+             "offsets": array.array("Q", [0]),
+             "abstracts": [],
+             "events": [],
+             "event_idx": {},
+             "texts": [],
+             "text_idx": {}}
+    for ev in list_events:
+        _intern(table["events"], table["event_idx"], ev["name"])
+    return table
+
+
+def _intern(values, index, value):
+    idx = index.get(value)
+    if idx is None:
+        idx = index[value] = len(values)
+        values.append(value)
+    return idx
+
+
+def _flag(values, i):
+    if values is None:
+        return -2
+    if values[i] is None:
+        return -1
+    return 1 if values[i] else 0
+
+
+def _unflag(flag):
+    return None if flag == -1 else flag == 1
+
+
+def add_abstract(table, abstract):
+    ''' METHOD: add the links of a scored (and filtered) abstract; the abstract itself can then be dropped
+    RETURN: the index of the abstract in the table, None if it has no link (it is not stored)
+    '''
+    if not abstract.get('score'):
+        return None
+    columns = table["columns"]
+    idx = len(table["abstracts"])
+    table["abstracts"].append({"pmid": abstract["pmid"], "pubdate": abstract["pubdate"],
+                               "title": abstract["title"]})
+    for event, values in abstract['score'].items():
+        event_idx = _intern(table["events"], table["event_idx"], event)
+        modal = values.get("modal")
+        modulateur = values.get("ismodulateur")
+        for i, score in enumerate(values["multiscore"]):
+            columns["abstract"].append(idx)
+            columns["event"].append(event_idx)
+            columns["sentence"].append(values["localisation"][i])
+            columns["text"].append(_intern(table["texts"], table["text_idx"], values["sentence"][i]))
+            columns["score"].append(score)
+            columns["words_found"].append(values["words_found"][i])
+            columns["words_to_find"].append(values["words_to_find"])
+            columns["modal"].append(_flag(modal, i))
+            columns["modulateur"].append(_flag(modulateur, i))
+    table["offsets"].append(len(columns["abstract"]))
+    return idx
+
+
+def nb_rows(table):
+    return len(table["columns"]["abstract"])
+
+
+def abstract_scores(table, idx):
+    ''' METHOD: the score dictionnary of an abstract (as built by compute_scores and results_filter)
+    RETURN: score -> a dictionnary event name -> values, empty if the abstract has no link
+    '''
+    columns = table["columns"]
+    score = {}
+    for row in range(table["offsets"][idx], table["offsets"][idx + 1]):
+        event = table["events"][columns["event"][row]]
+        values = score.get(event)
+        if values is None:
+            values = score[event] = {"multiscore": [], "localisation": [], "sentence": [],
+                                     "words_to_find": columns["words_to_find"][row], "words_found": []}
+        values["multiscore"].append(columns["score"][row])
+        values["localisation"].append(columns["sentence"][row])
+        values["sentence"].append(table["texts"][columns["text"][row]])
+        values["words_found"].append(columns["words_found"][row])
+        for column, key in (("modulateur", "ismodulateur"), ("modal", "modal")):
+            if columns[column][row] != -2:
+                values.setdefault(key, []).append(_unflag(columns[column][row]))
+    return score
+
+
+def _write_lines(path, values):
+    with open(path, "w", encoding="utf-8") as outfile:
+        for value in values:
+            outfile.write(json.dumps(value) + "\n")
+
+
+def _read_lines(path):
+    with open(path, encoding="utf-8") as infile:
+        return [json.loads(line) for line in infile]
+
+
+def _little_endian(values):
+    if sys.byteorder != "little":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def export_table(table, directory):
+    ''' METHOD: write the table in a folder: <column>.bin, offsets.bin, schema.json,
+                abstracts.jsonl, events.jsonl and texts.jsonl
+    '''
+    os.makedirs(directory, exist_ok=True)
+    schema = {"version": TABLE_VERSION, "rows": nb_rows(table), "abstracts": len(table["abstracts"]),
+              "columns": []}
+    arrays = list(table["columns"].items()) + [("offsets", table["offsets"])]
+    for name, values in arrays:
+        with open(os.path.join(directory, name + ".bin"), "wb") as outfile:
+            _little_endian(values).tofile(outfile)
+        schema["columns"].append({"name": name, "type": NUMPY_TYPES[values.typecode],
+                                  "typecode": values.typecode, "itemsize": values.itemsize})
+    _write_lines(os.path.join(directory, "abstracts.jsonl"), table["abstracts"])
+    _write_lines(os.path.join(directory, "events.jsonl"), table["events"])
+    _write_lines(os.path.join(directory, "texts.jsonl"), table["texts"])
+    with open(os.path.join(directory, "schema.json"), "w") as outfile:
+        json.dump(schema, outfile, indent=1)
+
+
+def load_table(directory):
+    ''' METHOD: read a table written by export_table
+    '''
+    with open(os.path.join(directory, "schema.json")) as infile:
+        schema = json.load(infile)
+    if schema["version"] != TABLE_VERSION:
+        raise ValueError("table version {} (expected {})".format(schema["version"], TABLE_VERSION))
+    table = new_table()
+    for column in schema["columns"]:
+        values = array.array(column["typecode"])
+        with open(os.path.join(directory, column["name"] + ".bin"), "rb") as infile:
+            values.frombytes(infile.read())
+        values = _little_endian(values)
+        if column["name"] == "offsets":
+            table["offsets"] = values
+        else:
+            table["columns"][column["name"]] = values
+    table["abstracts"] = _read_lines(os.path.join(directory, "abstracts.jsonl"))
+    for event in _read_lines(os.path.join(directory, "events.jsonl")):
+        _intern(table["events"], table["event_idx"], event)
+    for text in _read_lines(os.path.join(directory, "texts.jsonl")):
+        _intern(table["texts"], table["text_idx"], text)
+    return table
+
+
+def to_numpy(table):
+    ''' METHOD: the columns as numpy arrays (without copy), plus offsets (needs numpy)
+    '''
+    import numpy as np
+    arrays = {name: np.frombuffer(values, dtype=values.typecode) if len(values) else
+              np.zeros(0, dtype=NUMPY_TYPES[values.typecode]) for name, values in table["columns"].items()}
+    arrays["offsets"] = np.frombuffer(table["offsets"], dtype=np.uint64)
+    return arrays
+
+
+def export_npz(table, path):
+    ''' METHOD: write the table in a compressed .npz file (needs numpy)
+    '''
+    import numpy as np
+    arrays = to_numpy(table)
+    arrays["pmids"] = np.array([abstract["pmid"] for abstract in table["abstracts"]], dtype=str)
+    arrays["events"] = np.array(table["events"], dtype=str)
+    arrays["texts"] = np.array(table["texts"], dtype=str)
+    np.savez_compressed(path, **arrays)
+
+
+def export_parquet(table, path):
+    ''' METHOD: write the rows in a Parquet file, the events, texts and PMIDs being dictionary encoded
+                (needs pyarrow)
+    '''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    columns = table["columns"]
+    data = {name: pa.array(values) for name, values in columns.items()}
+    pmids = pa.array([abstract["pmid"] for abstract in table["abstracts"]])
+    data["pmid"] = pa.DictionaryArray.from_arrays(pa.array(columns["abstract"], pa.int32()), pmids)
+    data["event_name"] = pa.DictionaryArray.from_arrays(pa.array(columns["event"], pa.int32()),
+                                                        pa.array(table["events"]))
+    data["text_value"] = pa.DictionaryArray.from_arrays(pa.array(columns["text"], pa.int32()),
+                                                        pa.array(table["texts"]))
+    pq.write_table(pa.table(data), path)
+
+
+if __name__ == '__main__':
+    table = load_table(sys.argv[1])
+    counts = [0] * len(table["events"])
+    for event_idx in table["columns"]["event"]:
+        counts[event_idx] += 1
+    print("abstracts\t{}\nlinks\t{}".format(len(table["abstracts"]), nb_rows(table)))
+    for name, count in sorted(zip(table["events"], counts), key=lambda item: (-item[1], item[0])):
+        print("{}\t{}".format(name, count))
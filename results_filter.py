@@ -26,8 +26,7 @@
 #-------------------------------------------
 import tm_module as tm
 import compute_scores as cscores
-import spacy
-nlp = spacy.load("en_core_web_sm")
+from event_collection import events_named
 
 
 
@@ -87,6 +86,7 @@ def filter(abstract, event_values, event):
 def modulateur_detection(ev, lemma_supp):
             modulateur = None
             event = ev["lemma_name"]
+            nlp = tm.get_nlp()
             doc_c = nlp(event.capitalize())
             doc_l = nlp(event.lower())
             if doc_c[0].pos_ =="VERB" and doc_l[0].pos_ == "VERB" and (len(event.split()) > 3) :
@@ -106,6 +106,20 @@ def modulateur_detection(ev, lemma_supp):
             if lemma_supp is False and modulateur is None :
             	return ev["stemname"], modulateur
 
+"""
+Collecte les phrases (sans doublon) des resultats qui seront lemmatisees par results_filter
+Retourne un dictionnaire phrase -> vues de la phrase (tm.tokenise_abstract)
+"""
+def sentences_to_lemmatise(dict_abstracts, context_choice):
+    sentence_views = {}
+    for abstract in dict_abstracts:
+        if 'score' in abstract:
+            for event_values in abstract['score'].values():
+                for element in event_values["sentence"]:
+                    if element not in sentence_views:
+                        sentence_views[element] = tm.tokenise_abstract(element, context_choice)
+    return sentence_views
+
 """
 lemmatisation, detection des verbes modaux et du modulateur d'un event sur le dictionnaire de resultat
 Permet d'ajouter un/plusieurs filtres supplémentaires sur les resultats
@@ -113,80 +127,91 @@ dict_abstracts -> dictionnaire d'abstracts avec les resultats
 list_events -> liste des events d'intérets fournis en input
 lemma_supp, modal_supp et modulateur_supp -> booleen (True,False) permettant de choisir si on filtre ou non les resultats
 """
-def results_filter(dict_abstracts, list_events, lemma_supp, modal_supp, modulateur_supp, context_choice):
+def results_filter(dict_abstracts, list_events, lemma_supp, modal_supp, modulateur_supp, context_choice, batch_size=256, n_process=1):
+
+    # toutes les phrases a lemmatiser sont d'abord collectees (sans doublon) et lemmatisees
+    # ensemble par nlp.pipe (batch_size et n_process sont passes a nlp.pipe)
+    sentence_views = sentences_to_lemmatise(dict_abstracts, context_choice)
+    tm.fill_lemma_views(sentence_views.values(), batch_size, n_process)
 
     for abstract in dict_abstracts:
         if 'score' in abstract:
             for event, event_values in abstract['score'].copy().items():
-                for ev in list_events:
-                    if ev['name'] == event :
-                        sentence_full = event_values["sentence"]
-                        sentence = []
-                        modal_lemma = []
-                        for element in sentence_full :
-
-                            sentence_lemma, modal = tm.clean_abstract(element, True, False, "lemma",context_choice)
-                            # Si on veut lemma --> on garde les phrases lemma
-                            if lemma_supp is True : 
-                                sentence.append(' '.join(sentence_lemma))
-                            # Sinon on garde les phrases stem 
-                            else :
-                                sentence_stem = tm.clean_abstract(element, True, False, "stem",context_choice)
-                                sentence.append(' '.join(sentence_stem))
-                            modal_lemma.append(modal)
+                for ev in events_named(list_events, event):
+                    sentence_full = event_values["sentence"]
+                    sentence = []
+                    modal_lemma = []
+                    for element in sentence_full :
+                        # la phrase n'est tokenisee qu'une fois pour les vues lemma et stem
+                        views = sentence_views.get(element)
+                        if views is None:
+                            views = tm.tokenise_abstract(element, context_choice)
+                        sentence_lemma, modals = tm.lemma_view(views)
+                        modal = modals[-1] if modals else False
+                        # Si on veut lemma --> on garde les phrases lemma
+                        if lemma_supp is True : 
+                            sentence.append(' '.join(sentence_lemma))
+                        # Sinon on garde les phrases stem 
+                        else :
+                            sentence_stem = tm.stem_view(views)
+                            sentence.append(' '.join(sentence_stem))
+                        modal_lemma.append(modal)
 
                         
-                        ev["ev_without_modul"], modulateur = modulateur_detection(ev, lemma_supp)
+                    # the modulateur is detected once per event (see create_collection_event.prepare_events)
+                    if "modulateur" not in ev:
+                        ev["ev_without_modul"], ev["modulateur"] = modulateur_detection(ev, lemma_supp)
+                    modulateur = ev["modulateur"]
 
 
-                        modul_list = []
-                        if modulateur is not None :
-                            for phrase in sentence :
-                                if phrase.find(modulateur) == - 1:
-                                    modul_list.append(False)
-                                else : 
-                                    modul_list.append(True)
-                        else :
-                            for phrase in sentence :
-                                modul_list.append(None)
-                        event_values["ismodulateur"] = modul_list    
+                    modul_list = []
+                    if modulateur is not None :
+                        for phrase in sentence :
+                            if phrase.find(modulateur) == - 1:
+                                modul_list.append(False)
+                            else : 
+                                modul_list.append(True)
+                    else :
+                        for phrase in sentence :
+                            modul_list.append(None)
+                    event_values["ismodulateur"] = modul_list    
 
 
-                        if lemma_supp is True :
-                            ev_to_score = ev["lemma_name"]
+                    if lemma_supp is True :
+                        ev_to_score = ev["lemma_name"]
 
-                        else :
-                            ev_to_score = ev["stemname"]
+                    else :
+                        ev_to_score = ev["stemname"]
 
-                        if modulateur_supp is True :
-                            ev_to_score = ev["ev_without_modul"]
+                    if modulateur_supp is True :
+                        ev_to_score = ev["ev_without_modul"]
 
 
-                        multiscore, localisation, sentence, words_found = cscores.find_event(sentence, sentence_full, ev_to_score)
-                        event_values["words_to_find"] = len(ev_to_score.split())
+                    multiscore, localisation, sentence, words_found = cscores.find_event(sentence, sentence_full, ev_to_score)
+                    event_values["words_to_find"] = len(ev_to_score.split())
 
-                        event_values["multiscore"] = multiscore 
-                        event_values["sentence"] = sentence
-                        event_values["words_found"] = words_found
-                        event_values["modal"] = modal_lemma
+                    event_values["multiscore"] = multiscore 
+                    event_values["sentence"] = sentence
+                    event_values["words_found"] = words_found
+                    event_values["modal"] = modal_lemma
 
 
 
-                        localisation_list = []
-                        modal_list = []
-                        modulateur_list = []
-                        for element in localisation :
-                            localisation_list.append(event_values["localisation"][element])
-                            modal_list.append(event_values["modal"][element])
-                            modulateur_list.append(event_values["ismodulateur"][element])
+                    localisation_list = []
+                    modal_list = []
+                    modulateur_list = []
+                    for element in localisation :
+                        localisation_list.append(event_values["localisation"][element])
+                        modal_list.append(event_values["modal"][element])
+                        modulateur_list.append(event_values["ismodulateur"][element])
 
-                        event_values["localisation"] = localisation_list
-                        event_values["modal"] = modal_list
-                        event_values["ismodulateur"] = modulateur_list
+                    event_values["localisation"] = localisation_list
+                    event_values["modal"] = modal_list
+                    event_values["ismodulateur"] = modulateur_list
 
-                        if (modal_supp is True) or (modulateur_supp is True) :
-                            event_values = suppression(event_values, modal_supp, modulateur_supp)
+                    if (modal_supp is True) or (modulateur_supp is True) :
+                        event_values = suppression(event_values, modal_supp, modulateur_supp)
 
-                        abstract = filter(abstract, event_values, event)
+                    abstract = filter(abstract, event_values, event)
 
     return dict_abstracts
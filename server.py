@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+#authors: Florence Jornod - INSERM UMRS 1124
+#         Thomas Jaylet - Université de Paris - France
+#         Karine Audouze - Université de Paris - France
+
+#contact: systox@paris-descartes.fr
+
+
+#AOP-helpFinder is provided without any warranty. But if you have any probleme please feel free to contact us by mail.
+
+#------- WHAT IS AOPHELPFINDER? -------------
+
+#AOP-helpFinder is a tool developed to help AOP development (Jean-Charles Carvaillo: https://github.com/jecarvaill/aop-helpFinder)(Environ Health Perspect. 2019 Apr;127(4):47005).
+
+#It is based on text mining and parsing process on scientific abstracts. AOP-helpFinder identify links between stressors and molecular initiating event, key events and adverse outcomes through abstracts from the PubMed database (https://pubmed.ncbi.nlm.nih.gov/).
+
+#AOP-helpFinder was implemented under the H2020 Human Biomonintoring in Europe (HBM4EU) project, Work Package 13.1.
+#HBM4EU has received funding from the European Union’s H2020 research and innovation programme under grant agreement No 733032.
+
+#------- LICENCE ---------------------------
+
+#This software is governed by the CeCILL license under French law and abiding by the rules of distribution of free software.  You can  use,  modify and/ or redistribute the software under the terms of the CeCILL license as circulated by CEA, CNRS and INRIA at the following URL
+
+#http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
+#-------------------------------------------
+"""
+Scoring server: a long-running process which keeps the text mining tools,
+the compiled events and the workers warm, with a local HTTP/JSON API
+(asyncio, standard library only).
+
+    python server.py serve --events aopwiki=events.csv --workers 4 --port 8765
+    python server.py score --xml bisphenol-a.xml --events aopwiki --intro 20 \
+        --cleaning cleaning-yes --output bisphenol-a.ndjson
+    python server.py metrics
+
+The server listens on 127.0.0.1 (or on a Unix socket with --unix) and serves:
+
+    GET  /health    {"status": "ok"}
+    GET  /metrics   jobs, queue, abstracts and latencies (p50, p95, max)
+    POST /score     a job, as JSON:
+                      {"xml": "<PubmedArticleSet>...",   (or "path": a file of the server)
+                       "events": "aopwiki",               (an event set given to serve)
+                       "intro": 20, "cleaning": "cleaning-yes"}
+                    the results are streamed back (chunked, one JSON object per line):
+                    one line per abstract with a link (pmid, title, pubdate and score),
+                    then a line {"summary": ...} with the resume of the job
+                    (or a line {"error": ...} if the job fails while streaming)
+
+At most --max_jobs jobs run at the same time; the other ones wait in a queue
+of --max_queue jobs, beyond which a job is rejected (503). The abstracts of
+a job are scored by batches on a pool of --workers processes, which load
+every event set once.
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import http.client
+import io
+import itertools
+import json
+import os
+import socket
+import sys
+import time
+import extract_xml_withpmid as exxml
+import compute_output as cout
+import create_collection_event as ev
+import pipeline
+import profiling
+import tm_module as tm
+
+# abstracts sent at once to a worker
+BATCH_SIZE = 32
+# latencies kept for the percentiles of /metrics
+LATENCIES_KEPT = 1000
+# maximal size of a request body
+MAX_BODY = 512 * 1024 * 1024
+CLEANINGS = ("cleaning-yes", "cleaning-no")
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+######################################
+# WORKERS
+######################################
+
+# events of a worker process: bundle file -> list_events
+_worker_events = {}
+
+
+def _init_worker():
+    tm.init_tools(lemma=True)
+    profiling.take()
+
+
+def _events_for(bundle_filename):
+    # the bundles are compiled by serve, a worker only reads them
+    list_events = _worker_events.get(bundle_filename)
+    if list_events is None:
+        list_events = _worker_events[bundle_filename] = ev.read_bundle(bundle_filename)
+    return list_events
+
+
+def warm_worker(bundles):
+    ''' METHOD: load the events of every event set and cleaning option in a worker
+    ARGUMENTS: bundles -> (event set, cleaning) -> bundle file (see compile_bundles)
+    '''
+    for bundle_filename in bundles.values():
+        _events_for(bundle_filename)
+    return len(_worker_events)
+
+
+def abstract_result(abstract):
+    ''' METHOD: the part of a processed abstract sent back to the client
+    '''
+    result = {"pmid": abstract["pmid"], "title": abstract["title"], "pubdate": abstract["pubdate"]}
+    if abstract.get('score'):
+        result["score"] = abstract["score"]
+    return result
+
+
+def score_batch(bundle_filename, options, abstracts):
+    ''' METHOD: score and filter a batch of abstracts in a worker
+    RETURN: results -> see abstract_result, in the order of abstracts
+    '''
+    pipeline.process_batch(abstracts, _events_for(bundle_filename), options)
+    return [abstract_result(abstract) for abstract in abstracts]
+
+
+######################################
+# JOBS
+######################################
+
+def parse_job(body, event_sets, bundles):
+    ''' METHOD: read and check the JSON body of a job
+    RETURN: job -> a dictionnary with the bundle of the events, the options and the source of the abstracts
+    Raise ValueError if the job is not valid
+    '''
+    try:
+        request = json.loads(body)
+    except ValueError:
+        raise ValueError("the body is not valid JSON")
+    if not isinstance(request, dict):
+        raise ValueError("the body must be a JSON object")
+    if request.get("events") not in event_sets:
+        raise ValueError("unknown event set {!r} (known: {})".format(request.get("events"),
+                                                                   ", ".join(sorted(event_sets))))
+    if ("xml" in request) == ("path" in request):
+        raise ValueError("give either 'xml' or 'path'")
+    intro = request.get("intro", 20)
+    if not isinstance(intro, int) or not 0 <= intro <= 100:
+        raise ValueError("'intro' must be an integer between 0 and 100")
+    cleaning = request.get("cleaning", "cleaning-yes")
+    if cleaning not in CLEANINGS:
+        raise ValueError("'cleaning' must be one of {}".format(", ".join(CLEANINGS)))
+    source = request.get("path")
+    if source is None:
+        source = request["xml"].encode("utf-8")
+    return {"bundle": bundles[(request["events"], cleaning)],
+            "options": pipeline.make_options(intro, cleaning),
+            "source": source}
+
+
+def read_batches(job):
+    ''' METHOD: parse the abstracts of a job (without text mining, done by the workers), as they are needed
+    RETURN: a generator of lists of at most BATCH_SIZE abstracts
+    '''
+    source = job["source"]
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    abstracts = exxml.iter_abstracts_from_pubmedfile(source, job["options"]["context_choice"], preprocess=False)
+    abstracts = (abstract for abstract in abstracts if not abstract.get('delete'))
+    while True:
+        batch = list(itertools.islice(abstracts, BATCH_SIZE))
+        if not batch:
+            return
+        yield batch
+
+
+def next_batch(batches):
+    ''' METHOD: the next batch of read_batches, None at the end (run in a thread, the parse does not block the loop)
+    '''
+    return next(batches, None)
+
+
+######################################
+# SERVER
+######################################
+
+def new_server(event_sets, bundles, pool, workers, max_jobs, max_queue):
+    return {"event_sets": event_sets,
+            "bundles": bundles,
+            "pool": pool,
+            "window": max(1, workers) * 2,
+            "max_jobs": max_jobs,
+            "max_queue": max_queue,
+            "slots": None,
+            "queued": 0,
+            "running": 0,
+            "jobs_done": 0,
+            "jobs_failed": 0,
+            "jobs_rejected": 0,
+            "abstracts": 0,
+            "latencies": collections.deque(maxlen=LATENCIES_KEPT),
+            "waits": collections.deque(maxlen=LATENCIES_KEPT),
+            "started": time.time()}
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    return {"p50": values[int(round(0.5 * (len(values) - 1)))],
+            "p95": values[int(round(0.95 * (len(values) - 1)))],
+            "max": values[-1]}
+
+
+def metrics(server):
+    ''' METHOD: the metrics of the server (GET /metrics)
+    '''
+    return {"uptime_s": time.time() - server["started"],
+            "jobs_done": server["jobs_done"],
+            "jobs_failed": server["jobs_failed"],
+            "jobs_rejected": server["jobs_rejected"],
+            "running": server["running"],
+            "queued": server["queued"],
+            "max_jobs": server["max_jobs"],
+            "max_queue": server["max_queue"],
+            "abstracts": server["abstracts"],
+            "latency_s": percentiles(server["latencies"]),
+            "queue_wait_s": percentiles(server["waits"]),
+            "event_sets": sorted(server["event_sets"])}
+
+
+async def read_request(reader):
+    ''' METHOD: read an HTTP/1.1 request
+    RETURN: method, path, body
+    '''
+    request_line = (await reader.readline()).decode("latin-1").split()
+    if len(request_line) != 3:
+        raise ValueError("bad request line")
+    method, path = request_line[0], request_line[1]
+    length = 0
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, __, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value.strip())
+    if length > MAX_BODY:
+        raise OverflowError("body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, path, body
+
+
+def _head(status, content_type, headers=""):
+    return ("HTTP/1.1 {} {}\r\nContent-Type: {}\r\n{}Connection: close\r\n\r\n".format(
+        status, REASONS[status], content_type, headers)).encode("latin-1")
+
+
+async def send_json(writer, status, value):
+    body = json.dumps(value).encode("utf-8")
+    writer.write(_head(status, "application/json", "Content-Length: {}\r\n".format(len(body))) + body)
+    await writer.drain()
+
+
+async def send_line(writer, value):
+    line = (json.dumps(value) + "\n").encode("utf-8")
+    writer.write("{:x}\r\n".format(len(line)).encode("latin-1") + line + b"\r\n")
+    await writer.drain()
+
+
+async def run_job(server, body, writer):
+    ''' METHOD: run a job (POST /score) and stream its results
+    '''
+    try:
+        job = parse_job(body, server["event_sets"], server["bundles"])
+    except ValueError as error:
+        await send_json(writer, 400, {"error": str(error)})
+        return
+    if server["queued"] >= server["max_queue"]:
+        server["jobs_rejected"] += 1
+        await send_json(writer, 503, {"error": "too many jobs waiting"})
+        return
+    received = time.perf_counter()
+    server["queued"] += 1
+    try:
+        await server["slots"].acquire()
+    finally:
+        server["queued"] -= 1
+    server["running"] += 1
+    wait = time.perf_counter() - received
+    loop = asyncio.get_running_loop()
+    pending = collections.deque()
+    # the abstracts of the job are read one batch at a time, so that only the batches in the pool are in memory
+    batches = read_batches(job)
+
+    async def submit_next():
+        batch = await loop.run_in_executor(None, next_batch, batches)
+        if batch is None:
+            return False
+        pending.append(loop.run_in_executor(server["pool"], score_batch, job["bundle"], job["options"], batch))
+        return True
+
+    try:
+        try:
+            more = await submit_next()
+        except (OSError, ValueError, SyntaxError) as error:
+            server["jobs_failed"] += 1
+            await send_json(writer, 400, {"error": "cannot read the abstracts: {}".format(error)})
+            return
+        writer.write(_head(200, "application/x-ndjson", "Transfer-Encoding: chunked\r\n"))
+        resume = cout.new_resume()
+        try:
+            # a bounded number of batches of the job are in the pool at any time
+            while more and len(pending) < server["window"]:
+                more = await submit_next()
+            while pending:
+                results = await pending.popleft()
+                if more:
+                    more = await submit_next()
+                for result in results:
+                    cout.update_resume(resume, result)
+                    if "score" in result:
+                        await send_line(writer, result)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except Exception as error:
+            # the 200 header is sent: the error is the last line of the stream
+            sys.stderr.write("error\t{!r}\n".format(error))
+            server["jobs_failed"] += 1
+            for future in pending:
+                future.cancel()
+            pending.clear()
+            try:
+                await send_line(writer, {"error": repr(error)})
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+            except ConnectionError:
+                pass
+            return
+        latency = time.perf_counter() - received
+        await send_line(writer, {"summary": {"abstracts": resume["abstracts"],
+                                             "abstracts_with_link": resume["abstracts_with_link"],
+                                             "links": resume["links"],
+                                             "events": resume["events"],
+                                             "queue_wait_s": wait,
+                                             "latency_s": latency}})
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        server["jobs_done"] += 1
+        server["abstracts"] += resume["abstracts"]
+        server["latencies"].append(latency)
+        server["waits"].append(wait)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        # the client is gone: the batches not started yet are dropped
+        server["jobs_failed"] += 1
+        for future in pending:
+            future.cancel()
+    finally:
+        server["running"] -= 1
+        server["slots"].release()
+
+
+async def handle(server, reader, writer):
+    try:
+        method, path, body = await read_request(reader)
+        if path == "/health":
+            await send_json(writer, 200, {"status": "ok"})
+        elif path == "/metrics":
+            await send_json(writer, 200, metrics(server))
+        elif path == "/score":
+            if method != "POST":
+                await send_json(writer, 405, {"error": "use POST"})
+            else:
+                await run_job(server, body, writer)
+        else:
+            await send_json(writer, 404, {"error": "unknown path {}".format(path)})
+    except OverflowError as error:
+        await send_json(writer, 413, {"error": str(error)})
+    except (ValueError, asyncio.IncompleteReadError) as error:
+        await send_json(writer, 400, {"error": str(error)})
+    except ConnectionError:
+        pass
+    except Exception as error:
+        sys.stderr.write("error\t{!r}\n".format(error))
+        await send_json(writer, 500, {"error": repr(error)})
+    finally:
+        writer.close()
+
+
+async def serve_forever(server, host, port, unix):
+    server["slots"] = asyncio.Semaphore(server["max_jobs"])
+
+    async def handler(reader, writer):
+        await handle(server, reader, writer)
+
+    if unix:
+        listener = await asyncio.start_unix_server(handler, path=unix)
+        where = unix
+    else:
+        listener = await asyncio.start_server(handler, host, port)
+        where = "{}:{}".format(host, port)
+    sys.stderr.write("listening on {}\n".format(where))
+    async with listener:
+        await listener.serve_forever()
+
+
+def compile_bundles(event_sets):
+    ''' METHOD: compile (or check) the bundle of every event set and cleaning option, before the
+                workers start: the workers then only read them
+    RETURN: bundles -> (event set, cleaning) -> bundle file
+    '''
+    bundles = {}
+    for name, events_file in event_sets.items():
+        for cleaning in CLEANINGS:
+            options = pipeline.make_options(0, cleaning)
+            bundle_filename = ev.bundle_path(events_file, options)
+            ev.load_events(events_file, options, bundle_filename)
+            if not os.path.exists(bundle_filename):
+                sys.exit("cannot write the compiled events {}".format(bundle_filename))
+            bundles[(name, cleaning)] = bundle_filename
+    return bundles
+
+
+def serve(args):
+    event_sets = dict(item.split("=", 1) for item in args.events)
+    bundles = compile_bundles(event_sets)
+    if args.workers > 0:
+        pool = concurrent.futures.ProcessPoolExecutor(args.workers, initializer=_init_worker)
+    else:
+        # in this process, one batch at a time
+        pool = concurrent.futures.ThreadPoolExecutor(1, initializer=_init_worker)
+    for future in [pool.submit(warm_worker, bundles) for i in range(max(1, args.workers))]:
+        future.result()
+    server = new_server(event_sets, bundles, pool, args.workers, args.max_jobs, args.max_queue)
+    try:
+        asyncio.run(serve_forever(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+######################################
+# CLIENT
+######################################
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix socket."""
+
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.unix_path)
+
+
+def connect(args):
+    if args.unix:
+        return UnixHTTPConnection(args.unix, timeout=args.timeout)
+    return http.client.HTTPConnection(args.host, args.port, timeout=args.timeout)
+
+
+def client_get(args, path):
+    conn = connect(args)
+    conn.request("GET", path)
+    response = conn.getresponse()
+    print(response.read().decode("utf-8"))
+    return response.status == 200
+
+
+def client_score(args):
+    ''' METHOD: send a job and write the lines streamed back (stdout or --output)
+    '''
+    request = {"events": args.events, "intro": args.intro, "cleaning": args.cleaning}
+    if args.xml:
+        with exxml.open_xml(args.xml) as infile:
+            request["xml"] = infile.read().decode("utf-8")
+    else:
+        request["path"] = args.path
+    conn = connect(args)
+    conn.request("POST", "/score", json.dumps(request), {"Content-Type": "application/json"})
+    response = conn.getresponse()
+    if response.status != 200:
+        sys.stderr.write("{} {}\n".format(response.status, response.read().decode("utf-8")))
+        return False
+    output = open(args.output, "w") if args.output else sys.stdout
+    ok = True
+    try:
+        for line in response:
+            line = line.decode("utf-8")
+            if line.startswith('{"error"'):
+                sys.stderr.write(line)
+                ok = False
+                continue
+            output.write(line)
+            if line.startswith('{"summary"'):
+                sys.stderr.write(line)
+    finally:
+        if args.output:
+            output.close()
+    return ok
+
+
+def main(args):
+    if args.command == "serve":
+        serve(args)
+        return
+    if args.command == "score":
+        ok = client_score(args)
+    else:
+        ok = client_get(args, "/" + args.command)
+    sys.exit(0 if ok else 1)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("command", choices=["serve", "score", "metrics", "health"])
+parser.add_argument("--host", type=str, default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8765)
+parser.add_argument("--unix", type=str, help="Unix socket instead of host:port")
+# serve
+parser.add_argument("--events", type=str, nargs="*", default=[],
+                    help="serve: event sets, as id=events.csv; score: the id of the event set")
+parser.add_argument("--workers", type=int, default=1, help="serve: number of worker processes (0: in the server)")
+parser.add_argument("--max_jobs", type=int, default=2, help="serve: jobs running at the same time")
+parser.add_argument("--max_queue", type=int, default=16, help="serve: jobs waiting, beyond which a job is rejected")
+# score
+parser.add_argument("--xml", type=str, help="score: abstracts file (pubmed xml) sent to the server")
+parser.add_argument("--path", type=str, help="score: abstracts file read by the server")
+parser.add_argument("--intro", type=int, default=20)
+parser.add_argument("--cleaning", type=str, default="cleaning-yes")
+parser.add_argument("--output", type=str, help="score: file of the results (one JSON object per line)")
+parser.add_argument("--timeout", type=float, default=3600, help="client: timeout of the connection, in seconds")
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.command == "score":
+        if len(args.events) != 1:
+            parser.error("score needs one event set id (--events ID)")
+        args.events = args.events[0]
+    main(args)
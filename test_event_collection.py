@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import pickle
+from event_collection import EventCollection, events_named, event_by_id
+
+
+def _collection():
+    return EventCollection([{"id": "KE 1", "name": "apoptosis"},
+                            {"id": "KE 2", "name": "obesity"},
+                            {"id": "KE 3", "name": "apoptosis"}])
+
+
+def test_pickle_round_trip():
+    collection = _collection()
+    for protocol in range(2, pickle.HIGHEST_PROTOCOL + 1):
+        loaded = pickle.loads(pickle.dumps(collection, protocol=protocol))
+        assert isinstance(loaded, EventCollection)
+        assert list(loaded) == list(collection)
+        assert [ev["id"] for ev in events_named(loaded, "apoptosis")] == ["KE 1", "KE 3"]
+        assert event_by_id(loaded, "KE 2")["name"] == "obesity"
+        assert loaded.by_token is None
+
+
+def test_pickle_in_bundle():
+    # the bundle of create_collection_event is a dictionnary holding the collection
+    bundle = pickle.loads(pickle.dumps({"key": "k", "events": _collection()}))
+    assert events_named(bundle["events"], "obesity")[0]["id"] == "KE 2"
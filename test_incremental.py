@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import random
+import pytest
+
+for module in ("nltk", "spacy", "lxml", "requests", "unidecode"):
+    pytest.importorskip(module)
+
+import benchmark
+import compute_output as cout
+import create_collection_event as ev
+import extract_xml_withpmid as exxml
+import incremental
+import pipeline
+import result_store as rs
+import tm_module as tm
+
+CLEANINGS = ["cleaning-no", "cleaning-yes"]
+
+
+@pytest.fixture(scope="module", autouse=True)
+def tools():
+    try:
+        tm.init_tools(lemma=True)
+    except (OSError, LookupError) as error:
+        pytest.skip("text mining models not installed: {}".format(error))
+
+
+def write_xml(path, articles, deleted=()):
+    with open(path, "w") as outfile:
+        outfile.write('<?xml version="1.0" encoding="utf-8"?>\n<PubmedArticleSet>\n')
+        for article in articles:
+            outfile.write(article + "\n")
+        if deleted:
+            outfile.write("<DeleteCitation>{}</DeleteCitation>\n".format(
+                "".join('<PMID Version="1">{}</PMID>'.format(pmid) for pmid in deleted)))
+        outfile.write('</PubmedArticleSet>\n')
+
+
+def corpus(nb_abstracts, seed):
+    rng = random.Random(seed)
+    return {10000000 + i: benchmark.synthetic_article(10000000 + i, rng) for i in range(nb_abstracts)}
+
+
+def read_outputs(prefix):
+    with open(prefix + ".tsv") as output, open(prefix + "-resume.tsv") as resume:
+        return output.read(), resume.read()
+
+
+def full_run(tmp_path, xml, events_file, cleaning):
+    options = pipeline.make_options(20, cleaning)
+    list_events = ev.prepare_events(ev.create_collection_event(events_file), options)
+    prefix = str(tmp_path / "full")
+    stream = cout.open_stream(prefix, "tsv", list_events, prefix + "-resume.tsv")
+    abstracts = exxml.iter_abstracts_from_pubmedfile(xml, options["context_choice"], preprocess=False)
+    for abstract in pipeline.process_abstracts((a for a in abstracts if not a.get('delete')), list_events, options):
+        cout.write_abstract(stream, abstract)
+    cout.close_stream(stream)
+    return read_outputs(prefix)
+
+
+def store_run(tmp_path, files, events_file, cleaning, new_pmids=None):
+    ''' the outputs written from the store after the abstracts files (path, update) are applied '''
+    options = pipeline.make_options(20, cleaning)
+    list_events = ev.prepare_events(ev.create_collection_event(events_file), options)
+    store = rs.open_store(str(tmp_path / "store.sqlite"))
+    counters = incremental.new_counters()
+    for path, update in files:
+        abstracts = exxml.iter_abstracts_from_pubmedfile(path, options["context_choice"], preprocess=False)
+        for key, value in incremental.update_store(store, abstracts, list_events, options, update,
+                                                   new_pmids).items():
+            counters[key] += value
+    prefix = str(tmp_path / "store")
+    incremental.write_outputs(store, list_events, prefix, "tsv", prefix + "-resume.tsv")
+    rs.close_store(store)
+    return read_outputs(prefix), counters
+
+
+@pytest.mark.parametrize("cleaning", CLEANINGS)
+def test_store_runs_match_full_runs(tmp_path, cleaning):
+    articles = corpus(120, 0)
+    pmids = sorted(articles)
+    # three PMIDs found twice in the corpus
+    ordered = [articles[pmid] for pmid in pmids] + [articles[pmid] for pmid in pmids[5:8]]
+    xml = str(tmp_path / "corpus.xml")
+    write_xml(xml, ordered)
+    all_events = str(tmp_path / "events.csv")
+    benchmark.write_events(all_events, 60, 0)
+    with open(all_events) as infile:
+        names = infile.read().splitlines()
+    some_events = str(tmp_path / "events-some.csv")
+    with open(some_events, "w") as outfile:
+        outfile.write("\n".join(names[10:] + ["oxidative stress apoptosis"]) + "\n")
+
+    # initial run
+    outputs, counters = store_run(tmp_path, [(xml, False)], some_events, cleaning)
+    assert outputs == full_run(tmp_path, xml, some_events, cleaning)
+    assert counters["abstracts_new"] == len(pmids)
+
+    # events added and removed: the abstracts are not preprocessed again
+    outputs, counters = store_run(tmp_path, [(xml, False)], all_events, cleaning)
+    assert outputs == full_run(tmp_path, xml, all_events, cleaning)
+    assert counters["abstracts_new"] == counters["abstracts_revised"] == 0
+    assert counters["events_new"] == 10 and counters["events_removed"] == 1
+
+    # update file: a revised abstract (found twice), a deleted citation, a new PMID of the stressor
+    # and a PMID of another stressor
+    others = corpus(3, 1)
+    revised = dict(zip(pmids[6:7], others.values()))
+    new_articles = corpus(2, 2)
+    new_pmid, other_pmid = 20000000, 20000001
+    new_article = list(new_articles.values())[0].replace("10000000", str(new_pmid))
+    other_article = list(new_articles.values())[1].replace("10000001", str(other_pmid))
+    revised_article = revised[pmids[6]].replace(str(min(others)), str(pmids[6]))
+    update = str(tmp_path / "update.xml")
+    write_xml(update, [revised_article, new_article, other_article], deleted=[pmids[0]])
+    outputs, counters = store_run(tmp_path, [(update, True)], all_events, cleaning, {str(new_pmid)})
+    assert counters["abstracts_revised"] == 1 and counters["abstracts_new"] == 1
+    assert counters["abstracts_ignored"] == 1 and counters["abstracts_deleted"] == 1
+
+    updated = dict(articles)
+    updated[pmids[6]] = revised_article
+    expected = ([updated[pmid] for pmid in pmids[1:]] + [updated[pmid] for pmid in pmids[5:8]]
+                + [new_article])
+    expected_xml = str(tmp_path / "expected.xml")
+    write_xml(expected_xml, expected)
+    assert outputs == full_run(tmp_path, expected_xml, all_events, cleaning)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import random
+import pytest
+import profiling
+from proximity import best_window
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_proximity_windows.json")
+
+
+def graph_best_window(values):
+    ''' METHOD: reference implementation of best_window, with a networkx graph
+                (the historical code of presence_score)
+    '''
+    nx = pytest.importorskip("networkx")
+    G = nx.Graph()
+    for i in range(len(values) -1):
+        for j in range(len(values[i])):
+            for l in range(len(values[i + 1])):
+                G.add_edge(values[i][j], values[i+1][l], weight = abs(values[i+1][l]-values[i][j]))
+    shortest_paths = {}
+    for start in values[0]:
+        for end in values[-1]:
+            shortest_path = nx.dijkstra_path(G, start, end)
+            tot_weight = nx.dijkstra_path_length(G, start, end)
+            shortest_paths[tot_weight +1] = shortest_path
+    return min(shortest_paths, key = shortest_paths.get)
+
+
+def random_values(rng, nb_words, length):
+    ''' METHOD: random layers, as presence_score builds them from a sentence of `length` words
+    '''
+    words = [rng.randrange(nb_words + 2) for _ in range(length)]
+    values = []
+    for w in range(nb_words):
+        pos = [p + 1 for p, value in enumerate(words) if value == w]
+        if pos:
+            values.append(pos)
+    return sorted(values, key = lambda k: k[-1])
+
+
+def sentence_windows(sentence, events):
+    ''' METHOD: the layers of every event with at least two words found in a cleaned sentence
+    '''
+    words = sentence.split()
+    for event in events:
+        values = []
+        for e in set(event.split()):
+            pos = [p + 1 for p, value in enumerate(words) if value == e]
+            if pos:
+                values.append(pos)
+        if len(values) >= 2:
+            yield sorted(values, key = lambda k: k[-1])
+
+
+def load_fixture():
+    with open(FIXTURE) as infile:
+        return json.load(infile)
+
+
+# several paths of the same weight, or a smaller weight not selected by the graph version
+TIES = [[[1, 3], [2]],
+        [[1, 5], [3]],
+        [[3, 6], [4, 7]],
+        [[1, 4], [2, 5], [3, 6]],
+        [[2, 6], [4], [3, 5, 7]],
+        [[1, 9], [5], [2, 8, 10]]]
+
+
+def test_fixture_windows():
+    fixture = load_fixture()
+    windows = [values for sentence in fixture["sentences"] for values in sentence_windows(sentence, fixture["events"])]
+    assert windows == [window["values"] for window in fixture["windows"]]
+    for window in fixture["windows"]:
+        assert best_window(window["values"]) == window["best"]
+
+
+@pytest.mark.parametrize("values", TIES)
+def test_ties(values):
+    assert best_window(values) == graph_best_window(values)
+
+
+def test_fixture_against_graph():
+    for window in load_fixture()["windows"]:
+        assert best_window(window["values"]) == graph_best_window(window["values"])
+
+
+def test_random_against_graph():
+    rng = random.Random(0)
+    profiling.take()
+    nb_compared = 0
+    for _ in range(3000):
+        values = random_values(rng, rng.randint(2, 5), rng.randint(2, 30))
+        if len(values) < 2:
+            continue
+        nb_compared += 1
+        assert best_window(values) == graph_best_window(values), values
+    counters = profiling.take()["counters"]
+    assert nb_compared > 2000
+    # the tie-breaking of the paths was exercised
+    assert counters.get("proximity_path_rebuilds", 0) > 0
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import result_table
+
+
+def _abstracts():
+    filtered = {"multiscore": [1.0, 0.75], "localisation": [0, 2], "sentence": ["cell death", "the cell die"],
+                "words_to_find": 2, "words_found": [2, 1], "ismodulateur": [None, None], "modal": [True, False]}
+    modulated = {"multiscore": [1.5], "localisation": [1], "sentence": ["increas weight gain"],
+                 "words_to_find": 3, "words_found": [3], "ismodulateur": [True], "modal": [False]}
+    not_filtered = {"multiscore": [2.0], "localisation": [0], "sentence": ["cell death"],
+                    "words_to_find": 2, "words_found": [2]}
+    return [{"pmid": "1", "pubdate": "2020", "title": "first", "score": {"apoptosis": filtered,
+                                                                         "weight gain": modulated}},
+            {"pmid": "2", "pubdate": "2021", "title": "no link"},
+            {"pmid": "3", "pubdate": "2022", "title": "third", "score": {"apoptosis": not_filtered}}]
+
+
+def test_round_trip(tmp_path):
+    table = result_table.new_table([{"name": "weight gain"}, {"name": "apoptosis"}])
+    abstracts = _abstracts()
+    indexes = [result_table.add_abstract(table, abstract) for abstract in abstracts]
+    assert indexes == [0, None, 1]
+    assert result_table.nb_rows(table) == 4
+    # the text of a sentence is stored once
+    assert len(table["texts"]) == 3
+    result_table.export_table(table, str(tmp_path))
+    loaded = result_table.load_table(str(tmp_path))
+    assert loaded["events"] == ["weight gain", "apoptosis"]
+    assert [abstract["pmid"] for abstract in loaded["abstracts"]] == ["1", "3"]
+    for idx, abstract in zip(indexes, abstracts):
+        if idx is not None:
+            assert result_table.abstract_scores(table, idx) == abstract["score"]
+            assert result_table.abstract_scores(loaded, idx) == abstract["score"]
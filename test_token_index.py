@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import random
+import pytest
+import token_index as ti
+from event_collection import EventCollection
+
+cscores = pytest.importorskip("compute_scores")
+
+# a small vocabulary, so that the events are often (partly) found in the sentences
+VOCABULARY = ["cell", "death", "liver", "obes", "apoptosi", "receptor", "estrogen", "bind", "weight", "gain"]
+
+
+def random_sentences(rng):
+    return [" ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(0, 25)))
+            for _ in range(rng.randint(1, 8))]
+
+
+def random_events(rng):
+    return EventCollection({"name": "event {}".format(e),
+                            "stemname": " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(1, 4)))}
+                           for e in range(rng.randint(1, 12)))
+
+
+def reference_scores(sentences, list_events):
+    ''' METHOD: the scores of presence_score for every (event, sentence) pair with a score
+    '''
+    scores = {}
+    for e, event in enumerate(list_events):
+        event_split = list(set(event["stemname"].split()))
+        for s in range(len(sentences)):
+            best, cpt = cscores.presence_score(sentences, event_split, s)
+            if best != 0:
+                scores[(e, s)] = (best, cpt)
+    return scores
+
+
+def indexed_scores(sentences, list_events):
+    ''' METHOD: the same scores, from the candidate pairs of the inverted indexes
+    '''
+    event_index = ti.events_index(list_events)
+    pairs = ti.candidate_pairs(ti.index_abstract(sentence.split() for sentence in sentences), event_index)
+    scores = {}
+    for e, candidates in pairs.items():
+        for s, positions in candidates.items():
+            best, cpt = cscores.score_positions(positions, event_index['sizes'][e])
+            if best != 0:
+                scores[(e, s)] = (best, cpt)
+    return scores
+
+
+def test_random_against_presence_score():
+    rng = random.Random(0)
+    nb_scores = 0
+    for _ in range(500):
+        sentences = random_sentences(rng)
+        list_events = random_events(rng)
+        expected = reference_scores(sentences, list_events)
+        assert indexed_scores(sentences, list_events) == expected, (sentences, list(list_events))
+        nb_scores += len(expected)
+    assert nb_scores > 1000
+
+
+def test_no_common_token():
+    list_events = EventCollection([{"name": "obesity", "stemname": "obes"}])
+    index = ti.index_abstract([["cell", "death"], ["liver"]])
+    assert ti.candidate_pairs(index, ti.events_index(list_events)) == {}
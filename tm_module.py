@@ -37,6 +37,9 @@ Text mining module
 # IMPORT
 ######################################
 
+import time
+_import_start = time.perf_counter()
+
 # set the path of nltk_data
 import nltk.data
 nltk.data.path.append('./data/nltk_data/')
@@ -47,15 +50,195 @@ from nltk.tokenize import sent_tokenize
 from nltk import word_tokenize
 import re
 import string
+import sys
+from collections import OrderedDict
+import profiling
 
-
-import spacy
 """
 Spacy :
     - Reference : https://github.com/explosion/spaCy
     - Installation : https://spacy.io/usage
+spaCy is imported lazily by get_nlp() so that runs without lemmatisation
+do not pay for it.
 """
 
+######################################
+# TOOLS REGISTRY
+######################################
+
+NEGATIONS = ['never', 'neither', 'no', 'none', 'nor', 'not', 'ain',
+             'aren', 'couldn', 'didn', 'doesn', 'hadn', 'hasn', 'haven',
+             'isn', 'mightn', 'mustn', 'needn', 'shan', 'shouldn', 'wasn',
+             'weren', 'won', 'wouldn']
+
+CONTEXT_WORDS = [ "investigated", "investigate", "examined", "examine", "studied",
+            "tested", "assayed", "measured", "evaluated", "objective", "objectives",
+            "method", "methods", "background", "aimed", "context", "assesses", "explored",
+            "aim","assays", "evaluate", "explore", "goal", "analyzed", "monitored",
+            "abbreviations", "performed", "examining", "conducted", "compiles",
+            "purpose", "recruiter", "assessed", "assess", "explores"]
+
+SPACY_MODEL = "en_core_web_sm"
+# the lemmatizer only needs tok2vec, tagger and attribute_ruler: the parser
+# and the named entity recognizer are never used by AOP-helpFinder
+SPACY_DISABLE = ["parser", "ner"]
+
+# tools are loaded once per process (so once per worker when parallel)
+_registry = {}
+# name -> seconds spent loading the tool
+load_timings = {"nltk_import": time.perf_counter() - _import_start}
+
+
+def _load(name, loader):
+    """Return the tool registered under name, loading it on first use."""
+    if name not in _registry:
+        t0 = time.perf_counter()
+        _registry[name] = loader()
+        load_timings[name] = time.perf_counter() - t0
+    return _registry[name]
+
+
+def _load_spacy():
+    import spacy
+    return spacy.load(SPACY_MODEL, disable=SPACY_DISABLE)
+
+
+def get_nlp():
+    """Return the spaCy pipeline (without the components of SPACY_DISABLE)."""
+    return _load("spacy", _load_spacy)
+
+
+def set_spacy_disable(components):
+    """Choose the spaCy components to disable. The pipeline is reloaded on
+    the next call to get_nlp().
+    """
+    global SPACY_DISABLE
+    SPACY_DISABLE = list(components)
+    _registry.pop("spacy", None)
+    _memo["lemma"].clear()
+
+
+def get_stemmer():
+    """Return the snowball stemmer (Martin Porter)."""
+    return _load("stemmer", lambda: nltk.stem.SnowballStemmer('english'))
+
+
+def get_stopwords():
+    """Return the frozenset of stopwords, punctuation and 's."""
+    return _load("stopwords", lambda: frozenset(
+        nltk.corpus.stopwords.words('english') + list(string.punctuation)
+        + ['\'s']))
+
+
+def get_negations():
+    return _load("negations", lambda: frozenset(NEGATIONS))
+
+
+def get_contexts():
+    """Return the context words, regardless of the writing style (upper,
+    lower, capitalize).
+    """
+    def loader():
+        contexts = set()
+        for word in CONTEXT_WORDS:
+            contexts.update((word.capitalize(), word.upper(), word.lower()))
+        return frozenset(contexts)
+    return _load("contexts", loader)
+
+
+def init_tools(lemma=True):
+    """Load every tool now instead of on first use (for example in the
+    initializer of a worker). Return the load timings.
+    """
+    get_stemmer()
+    get_stopwords()
+    get_negations()
+    get_contexts()
+    if lemma:
+        get_nlp()
+    return load_timings
+
+
+def report_timings(output=sys.stderr):
+    """Write the startup and load timings of the registry."""
+    for name, seconds in load_timings.items():
+        output.write("{}\t{:.3f}s\n".format(name, seconds))
+
+
+######################################
+# SENTENCE MEMO
+######################################
+
+# bounded LRU memo of the stemmed and lemmatised sentences, shared by the
+# preprocessing of the abstracts (before compute_scores) and results_filter:
+#   "stem"  -> words of a sentence without stopwords -> stemmed sentence
+#   "lemma" -> lowercased sentence without stopwords -> (lemmas, modal)
+# the lemma memo is cleared when the spaCy pipeline changes
+MEMO_SIZE = 100000
+_memo = {"stem": OrderedDict(), "lemma": OrderedDict()}
+_memo_counters = {"stem": [0, 0], "lemma": [0, 0]}
+
+
+def _memo_get(kind, key):
+    memo = _memo[kind]
+    if key in memo:
+        memo.move_to_end(key)
+        _memo_counters[kind][0] += 1
+        return memo[key]
+    _memo_counters[kind][1] += 1
+    return None
+
+
+def _memo_put(kind, key, value):
+    memo = _memo[kind]
+    memo[key] = value
+    if len(memo) > MEMO_SIZE:
+        memo.popitem(last=False)
+
+
+def set_memo_size(size):
+    """Set the maximal number of sentences of each memo (0 disables it)."""
+    global MEMO_SIZE
+    MEMO_SIZE = size
+    for memo in _memo.values():
+        while len(memo) > MEMO_SIZE:
+            memo.popitem(last=False)
+
+
+def take_memo_counters():
+    """Return the hit/miss counters of the memos of this process and reset them
+    (a worker sends them back with each batch, see merge_memo_counters)."""
+    global _memo_counters
+    counters = _memo_counters
+    _memo_counters = {kind: [0, 0] for kind in counters}
+    return counters
+
+
+def merge_memo_counters(counters):
+    """Add the hit/miss counters of another process (see take_memo_counters)."""
+    for kind, (hits, misses) in counters.items():
+        _memo_counters[kind][0] += hits
+        _memo_counters[kind][1] += misses
+
+
+def memo_stats():
+    """Return the hits, misses (with the ones of the workers), hit rate and size (of this
+    process) of each memo."""
+    stats = {}
+    for kind, (hits, misses) in _memo_counters.items():
+        lookups = hits + misses
+        stats[kind] = {"hits": hits, "misses": misses, "size": len(_memo[kind]),
+                       "hit_rate": hits / lookups if lookups else 0.0}
+    return stats
+
+
+def report_memo(output=sys.stderr):
+    """Write the hit-rate counters of the memos."""
+    for kind, stats in memo_stats().items():
+        output.write("memo_{}\thits {}\tmisses {}\thit_rate {:.3f}\tsize {}\n".format(
+            kind, stats["hits"], stats["misses"], stats["hit_rate"], stats["size"]))
+
+
 ######################################
 # FUNCTION
 ######################################
@@ -79,79 +262,123 @@ def clean_abstract(abstract, clean_all, case, process, context_choice):
         "lemma" = lemmatization -> look at surrounding text to determine a given word's part
         "stem" = stemming -> keep only root
 
+    To get several views of the same abstract, use tokenise_abstract() and
+    the *_view() functions: the abstract is then tokenised only once.
+
     
     Return:
         abstract (str): cleaned and simplified abstract
 
     """
-    # set list of tools
-    negations = ['never', 'neither', 'no', 'none', 'nor', 'not', 'ain',
-                 'aren', 'couldn', 'didn', 'doesn', 'hadn', 'hasn', 'haven',
-                 'isn', 'mightn', 'mustn', 'needn', 'shan', 'shouldn', 'wasn',
-                 'weren', 'won', 'wouldn']
-
-    context_word = [ "investigated", "investigate", "examined", "examine", "studied",
-                "tested", "assayed", "measured", "evaluated", "objective", "objectives",
-                "method", "methods", "background", "aimed", "context", "assesses", "explored",
-                "aim","assays", "evaluate", "explore", "goal", "analyzed", "monitored",
-                "abbreviations", "performed", "examining", "conducted", "compiles",
-                "purpose", "recruiter", "assessed", "assess", "explores"]
-	#To remove regardless of the writing style (upper, lower, capitalize)    
-    contexts = []
-    for word in context_word :
-    	contexts.append(word.capitalize())
-    	contexts.append(word.upper())
-    	contexts.append(word.lower())
-
-                 
-    punctuation = list(string.punctuation)
-    stop = nltk.corpus.stopwords.words('english') + punctuation + ['\'s']
+    views = tokenise_abstract(abstract, context_choice)
+    modal = None
+    if clean_all is not True:
+        abstract = full_view(views)
+    elif process == "stem":
+        abstract = stem_view(views)
+    elif process == "lemma":
+        abstract, modals = lemma_view(views)
+        # the modal of the last sentence, False if there is none
+        modal = modals[-1] if modals else False
+
+    # 6. AOD or KEr search case
+    if case is True:
+        abstract = ' '.join(abstract)
+    if process == "lemma":
+        return abstract, modal
+    return abstract
+
+
+def tokenise_abstract(abstract, context_choice):
+    """Steps 1, 2 and 3 of clean_abstract, done once for all the views of
+    an abstract (full_view, stem_view, lemma_view). The views are computed
+    on first request and kept in the returned dictionary.
+
+    Return:
+        views (dict): `sentences` -> the words of every sentence of the
+        abstract, `kept` -> the indexes of the sentences kept by the
+        filters (numbers with 'body weight', negations, context words)
+    """
+    negations = get_negations()
+    contexts = get_contexts()
 
     # 1. split abstract by sentences
     sents = sent_tokenize(abstract)
 
-    sents = [sent for sent in sents if not (bool(re.search('\d', sent) and
-             'body weight' in sent))]
-
     # 2. split sentences by words
-    abstract = [word_tokenize(sent) for sent in sents]
+    sentences = [word_tokenize(sent) for sent in sents]
+
+    # 3. remove sentences with a number and 'body weight', and sentences
+    # which contain a negation or context word
+    kept = []
+    for i, sent in enumerate(sentences):
+        if bool(re.search('\d', sents[i]) and 'body weight' in sents[i]):
+            continue
+        if not negations.isdisjoint(sent):
+            continue
+        if context_choice is True and not contexts.isdisjoint(sent):
+            continue
+        kept.append(i)
+    return {'sentences': sentences, 'kept': kept}
+
+
+def _clean_words(views):
+    # 4. remove stopwords in sentences
+    if 'clean_words' not in views:
+        stop = get_stopwords()
+        views['clean_words'] = [[word for word in views['sentences'][i] if word not in stop]
+                                for i in views['kept']]
+    return views['clean_words']
 
-    # 3. remove sentences which contain a negation or context word
-    abstract = [sent for sent in abstract if not
-                any(negation in sent for negation in negations)]
-    if(context_choice is True):
-        abstract =  abstract = [sent for sent in abstract if not
-                    any(context in sent for context in contexts)]
 
-    # 4. remove stopwords in sentences
-    if clean_all is True :
-        for i in range(len(abstract)):
-            abstract[i] = [word for word in abstract[i] if word not in stop]
-
-    # 5. stem process
-
-    for i in range(len(abstract)):
-        if clean_all is True :
-            #print(abstract[i])
-            if process == "stem" :
-                abstract[i] = stem_process(abstract[i])
-            elif process == "lemma" :
-                abstract[i], modal = lemma_process(abstract[i])
-        abstract[i] = ' '.join(abstract[i])
-        # List of list --> List
+def full_view(views):
+    """Return the kept sentences with all their words (clean_all=False)."""
+    if 'full' not in views:
+        views['full'] = [' '.join(views['sentences'][i]) for i in views['kept']]
+    return views['full']
+
+
+def stem_view(views):
+    """Return the kept sentences without stopwords and stemmed."""
+    if 'stem' not in views:
+        views['stem'] = [stem_sentence(words) for words in _clean_words(views)]
+    return views['stem']
 
-    # 6. AOD or KEr search case
-    if case is True:
-        abstract = ' '.join(abstract)
-        if process == "stem" :
-            return abstract
-        elif process == "lemma" :
-            return abstract, modal
-    else:
-        if process == "stem" :
-            return abstract
-        elif process == "lemma" : 
-            return abstract, modal
+
+def stem_sentence(words):
+    """Return the stemmed sentence of a list of words (memoised)."""
+    key = tuple(words)
+    sentence = _memo_get("stem", key)
+    if sentence is None:
+        sentence = ' '.join(stem_process(list(words)))
+        _memo_put("stem", key, sentence)
+    return sentence
+
+
+def lemma_view(views):
+    """Return the kept sentences without stopwords and lemmatised, and for
+    each sentence whether it contains a modal verb.
+    """
+    if 'lemma' not in views:
+        sentences = []
+        modals = []
+        for words in _clean_words(views):
+            lemmas, modal = lemma_process(words)
+            sentences.append(' '.join(lemmas))
+            modals.append(modal)
+        views['lemma'] = (sentences, modals)
+    return views['lemma']
+
+
+def sentence_origin(views):
+    """Return, for each kept sentence, the index of the sentence in the
+    abstract (the last one if the same sentence appears several times), and
+    the number of sentences of the abstract.
+    """
+    last_index = {}
+    for i, sent in enumerate(views['sentences']):
+        last_index[' '.join(sent)] = i
+    return [last_index[sentence] for sentence in full_view(views)], len(views['sentences'])
 
 
 def stem_process(words):
@@ -162,7 +389,7 @@ def stem_process(words):
 
     """
     # snowball stemmers developed by Martin Poter
-    sno = nltk.stem.SnowballStemmer('english')
+    sno = get_stemmer()
     # search if a particular word is in words
     for i in range(len(words)):
         words[i] = sno.stem(words[i])
@@ -171,10 +398,20 @@ def stem_process(words):
 
 def lemma_process(words):
     #print(words)
-    nlp = spacy.load("en_core_web_sm")
-    words = ' '.join(words)
-    #print(words)
-    doc = nlp(words.lower())
+    words = ' '.join(words).lower()
+    result = _memo_get("lemma", words)
+    if result is None:
+        nlp = get_nlp()
+        profiling.count("spacy_calls")
+        doc = nlp(words)
+        result = lemma_doc(doc)
+        _memo_put("lemma", words, result)
+    lemma_list, modal = result
+    return list(lemma_list), modal
+
+
+def lemma_doc(doc):
+    """Return the lemmas of a spaCy doc and whether it contains a modal verb."""
     lemma_list = []
     modal = False
     for token in doc:
@@ -185,6 +422,39 @@ def lemma_process(words):
     return lemma_list, modal
 
 
+def fill_lemma_views(views_list, batch_size=256, n_process=1):
+    """Compute the lemma_view of many abstracts (or sentences) at once: the
+    distinct sentences are lemmatised together with nlp.pipe.
+
+    views_list: views from tokenise_abstract, completed in place
+    batch_size, n_process: passed to nlp.pipe
+    """
+    pending = [views for views in views_list if 'lemma' not in views]
+    lemmas = {}
+    for views in pending:
+        for words in _clean_words(views):
+            text = ' '.join(words).lower()
+            if text not in lemmas:
+                lemmas[text] = _memo_get("lemma", text)
+    texts = [text for text, result in lemmas.items() if result is None]
+    if texts:
+        profiling.count("spacy_pipe_calls")
+        profiling.count("spacy_docs", len(texts))
+        docs = get_nlp().pipe(texts, batch_size=batch_size, n_process=n_process)
+        for text, doc in zip(texts, docs):
+            lemmas[text] = lemma_doc(doc)
+            _memo_put("lemma", text, lemmas[text])
+    for views in pending:
+        sentences = []
+        modals = []
+        for words in _clean_words(views):
+            lemma_list, modal = lemmas[' '.join(words).lower()]
+            sentences.append(' '.join(lemma_list))
+            modals.append(modal)
+        views['lemma'] = (sentences, modals)
+    return views_list
+
+
 
 
 ######################################
@@ -193,7 +463,7 @@ def lemma_process(words):
 
 if __name__ == '__main__':
     abstract = "Mitophagy ( an autophagic process that specifically involves damaged mitochondria ) may be involved , as judged from the decreased amount of mitochondrial DNA ."
-    abstract1 = clean_abstract(abstract, True ,False, "lemma")
+    abstract1 = clean_abstract(abstract, True ,False, "lemma", False)
     print(abstract1)
-    abstract2 = clean_abstract(abstract, True, False, "stem")
+    abstract2 = clean_abstract(abstract, True, False, "stem", False)
     print(abstract2)
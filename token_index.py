@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#authors: Florence Jornod - INSERM UMRS 1124
+#         Thomas Jaylet - Université de Paris - France
+#         Karine Audouze - Université de Paris - France
+
+#contact: systox@paris-descartes.fr
+
+
+#AOP-helpFinder is provided without any warranty. But if you have any probleme please feel free to contact us by mail.
+
+#------- WHAT IS AOPHELPFINDER? -------------
+
+#AOP-helpFinder is a tool developed to help AOP development (Jean-Charles Carvaillo: https://github.com/jecarvaill/aop-helpFinder)(Environ Health Perspect. 2019 Apr;127(4):47005).
+
+#It is based on text mining and parsing process on scientific abstracts. AOP-helpFinder identify links between stressors and molecular initiating event, key events and adverse outcomes through abstracts from the PubMed database (https://pubmed.ncbi.nlm.nih.gov/).
+
+#AOP-helpFinder was implemented under the H2020 Human Biomonintoring in Europe (HBM4EU) project, Work Package 13.1.
+#HBM4EU has received funding from the European Union’s H2020 research and innovation programme under grant agreement No 733032.
+
+#------- LICENCE ---------------------------
+
+#This software is governed by the CeCILL license under French law and abiding by the rules of distribution of free software.  You can  use,  modify and/ or redistribute the software under the terms of the CeCILL license as circulated by CEA, CNRS and INRIA at the following URL
+
+#http://cecill.info/licences/Licence_CeCILL_V2.1-en.txt
+#-------------------------------------------
+"""
+Inverted index of a preprocessed abstract (see index_abstract):
+
+    stemmed token -> {sentence index: [positions]}
+
+Positions start at 1, as in compute_scores.presence_score. An event is then
+only scored on the sentences which contain at least the presence threshold
+of its tokens.
+
+The events are indexed the same way (token -> events, see events_index), so
+the overlap counts of every (event, sentence) pair of an abstract are
+computed at once by candidate_pairs, as the sparse product of the
+sentence x token and token x event incidence matrices: only the tokens of the
+abstract which belong to an event are visited, and the events without any
+common token are never looked at.
+"""
+from collections import Counter
+from itertools import chain
+from event_collection import EventCollection
+
+# minimal proportion of the words of an event found in a sentence
+# (see compute_scores.presence_score)
+THRESHOLD = 0.75
+
+
+def index_abstract(sentence_tokens):
+    ''' METHOD: index the tokens of the cleaned sentences of one abstract
+    ARGUMENTS: sentence_tokens -> an iterable of lists of tokens (one per sentence)
+    RETURN: index -> a dictionnary token -> {sentence index: positions}
+    '''
+    index = {}
+    for s, tokens in enumerate(sentence_tokens):
+        for pos, token in enumerate(tokens, 1):
+            index.setdefault(token, {}).setdefault(s, []).append(pos)
+    return index
+
+
+def abstract_index(abstract):
+    ''' METHOD: the index of one abstract, precomputed by the parser if available
+    '''
+    if abstract.get('token_positions') is not None:
+        return abstract['token_positions']
+    return index_abstract(sentence.split() for sentence in abstract['abstract'])
+
+
+def events_index(list_events):
+    ''' METHOD: index the stemmed tokens of the events (kept on an EventCollection, built once)
+    RETURN: event_index -> a dictionnary with 'by_token' (token -> indexes of the events in list_events),
+                           'tokens' (distinct tokens of each event) and 'sizes' (their number)
+    '''
+    event_index = getattr(list_events, 'by_token', None)
+    if event_index is not None:
+        return event_index
+    event_index = {'by_token': {}, 'tokens': [], 'sizes': []}
+    for e, event in enumerate(list_events):
+        tokens = event.get("tokens")
+        if tokens is None:
+            tokens = frozenset(event["stemname"].split())
+        event_index['tokens'].append(tokens)
+        event_index['sizes'].append(len(tokens))
+        for token in tokens:
+            event_index['by_token'].setdefault(token, []).append(e)
+    if isinstance(list_events, EventCollection):
+        list_events.by_token = event_index
+    return event_index
+
+
+def candidate_pairs(index, event_index):
+    ''' METHOD: find, for every event at once, the sentences of an abstract which may contain it
+    ARGUMENTS: index -> the index of the abstract (see index_abstract)
+               event_index -> the index of the events (see events_index)
+    RETURN: pairs -> a dictionnary event index -> candidates, only for the events with at least one
+            candidate sentence; candidates is a dictionnary sentence index -> {token of the event:
+            positions}, only for the sentences with at least THRESHOLD of the tokens of the event
+    '''
+    by_token = event_index['by_token']
+    sizes = event_index['sizes']
+    # tokens of the events in each sentence, with their positions
+    sentences = {}
+    for token, postings in index.items():
+        if token in by_token:
+            for s, positions in postings.items():
+                sentences.setdefault(s, {})[token] = positions
+    pairs = {}
+    for s, found in sentences.items():
+        # one pass over the tokens of the sentence counts the common tokens of every event
+        overlaps = Counter(chain.from_iterable(by_token[token] for token in found))
+        for e, overlap in overlaps.items():
+            if THRESHOLD <= overlap/sizes[e]:
+                tokens = event_index['tokens'][e]
+                pairs.setdefault(e, {})[s] = {token: positions for token, positions in found.items()
+                                              if token in tokens}
+    return pairs